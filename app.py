@@ -1,13 +1,58 @@
 import os
+import re
+import atexit
+import csv
+import gzip
+import html
+import itertools
+import math
 import sqlite3
+import base64
 import hashlib
+import heapq
+import hmac
+import mimetypes
 import secrets
 import json
-from datetime import datetime
+import queue
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
 from functools import wraps
-from werkzeug.utils import secure_filename
+import click
+from urllib.parse import quote
+from werkzeug.utils import secure_filename, send_file as wz_send_file
+from werkzeug.http import http_date
+from markupsafe import Markup
+
+try:
+    import pypdf  # optional: PDF text extraction and exact page counts
+except ImportError:
+    pypdf = None
+try:
+    from PIL import Image  # optional: image thumbnails
+except ImportError:
+    Image = None
+try:
+    import fitz  # optional (PyMuPDF): PDF first-page thumbnails
+except ImportError:
+    fitz = None
+try:
+    import numpy as np  # optional: vectorized rebuild of the similar-resources index
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+try:
+    import brotli  # optional: .br variants of static assets
+except ImportError:
+    brotli = None
 from flask import (Flask, render_template, request, redirect, url_for,
-                   session, flash, jsonify, send_from_directory, abort)
+                   session, flash, jsonify, send_from_directory, abort, g)
+from flask.signals import before_render_template, template_rendered
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
@@ -16,26 +61,271 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'instance', 'neural_breach.db')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'doc', 'ppt', 'pptx', 'png', 'jpg', 'jpeg', 'txt', 'zip'}
+# Already-compressed formats; ZIP exports deflate these at level 0 (no real compression)
+PRECOMPRESSED_EXTENSIONS = {'zip', 'pptx', 'docx', 'png', 'jpg', 'jpeg'}
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
+IMPORT_BATCH_SIZE = 500                  # manifest rows per import transaction
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # read/hash uploads 1MB at a time
+STAGING_MAX_AGE = 3600                   # untouched files in UPLOAD_FOLDER/tmp older than this are swept
+MAX_BYTE_RANGES = 32  # more ranges than this in one request gets the whole file
+SEARCH_PAGE_SIZE = 24
+FACET_LIMIT = 12                         # values listed per search facet
+SIMILAR_SHOWN = 6                        # similar resources listed on the detail page
+SIMILAR_MIN_SCORE = 0.001                # weaker neighbours aren't stored
+EVENTS_BACKLOG = 256                     # recent live events kept for Last-Event-ID replay
+EVENTS_QUEUE_SIZE = 64                   # events buffered per stream before it is dropped
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+BOOKMARK_BATCH_MAX = 100                 # operations accepted by one POST /api/bookmarks
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
+# SQLite tuning. Any of these can be overridden from the environment with a
+# FLASK_ prefix, e.g. FLASK_DATABASE=/srv/nb.db or FLASK_DB_POOL_SIZE=16.
+app.config['DATABASE'] = DB_PATH
+app.config['DB_POOL_SIZE'] = 8                    # idle connections kept per process
+app.config['DB_BUSY_TIMEOUT_MS'] = 5000
+app.config['DB_JOURNAL_MODE'] = 'WAL'             # readers never block on writers
+app.config['DB_SYNCHRONOUS'] = 'NORMAL'           # safe with WAL, skips fsync per commit
+app.config['DB_CACHE_SIZE_KB'] = 16 * 1024
+app.config['DB_MMAP_SIZE'] = 256 * 1024 * 1024
+# Download counts are buffered in memory and written in one transaction
+# every DOWNLOAD_FLUSH_INTERVAL seconds or DOWNLOAD_FLUSH_MAX_EVENTS downloads
+app.config['DOWNLOAD_FLUSH_INTERVAL'] = 5.0
+app.config['DOWNLOAD_FLUSH_MAX_EVENTS'] = 200
+# File offload: '' serves bytes from Python; 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache/lighttpd) hand the transfer to the front proxy after
+# the access check. FILE_OFFLOAD_STANDIN makes this process play the proxy
+# for local testing.
+app.config['FILE_OFFLOAD'] = ''
+app.config['FILE_OFFLOAD_PREFIX'] = '/_protected_uploads/'
+app.config['FILE_OFFLOAD_STANDIN'] = False
+# Process-local cache of users rows for get_current_user()
+app.config['USER_CACHE_SIZE'] = 1024
+app.config['USER_CACHE_TTL'] = 30.0
+# Shared cache for the home feed fragment and /api/resources responses.
+# Entries are keyed on the data version, so writes invalidate them; the TTL
+# only bounds how stale download counts can get.
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+app.config['RESPONSE_CACHE_TTL'] = 60.0
+# Background jobs (text extraction, thumbnails, page counts). Set
+# JOB_WORKERS=0 to run them only in a separate `flask run-jobs` process.
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_POLL_INTERVAL'] = 2.0
+app.config['JOB_MAX_ATTEMPTS'] = 3
+app.config['JOB_RETRY_DELAY'] = 30        # seconds, doubled on each retry
+app.config['JOB_STALE_AFTER'] = 600       # requeue 'running' jobs older than this
+app.config['JOB_SHUTDOWN_TIMEOUT'] = 30   # seconds exit waits for running jobs
+app.config['THUMBNAIL_WIDTH'] = 320
+# Thumbnails show page 1 of private files too, so they live outside the
+# static tree and are only served through the access check
+app.config['THUMBNAIL_FOLDER'] = os.path.join(BASE_DIR, 'instance', 'thumbnails')
+app.config['EXTRACT_MAX_CHARS'] = 200_000
+# Trending: downloads are logged in batches and rolled up into time-decayed
+# scores every TRENDING_ROLLUP_INTERVAL seconds by a background job.
+app.config['TRENDING_HALF_LIFE_HOURS'] = 48.0
+app.config['TRENDING_WINDOW_DAYS'] = 14   # download events older than this are dropped
+app.config['TRENDING_ROLLUP_INTERVAL'] = 600
+app.config['HOME_TRENDING_SIZE'] = 6
+# "Similar resources": text similarity plus co-bookmarks and co-reviews,
+# top SIMILAR_TOP_K neighbours stored per resource. Updated per resource as
+# bookmarks/reviews arrive and rebuilt in full every SIMILAR_REBUILD_INTERVAL.
+app.config['SIMILAR_TOP_K'] = 20
+app.config['SIMILAR_TEXT_WEIGHT'] = 0.5
+app.config['SIMILAR_BOOKMARK_WEIGHT'] = 0.3
+app.config['SIMILAR_REVIEW_WEIGHT'] = 0.2
+app.config['SIMILAR_REBUILD_INTERVAL'] = 86400
+# Static assets referenced through asset_url() get content-hashed copies
+# (with .gz/.br variants) under static/dist/, cached by browsers this long
+app.config['ASSET_MAX_AGE'] = 365 * 86400
+# ZIP exports (/export.zip): at most EXPORT_MAX_ITEMS files and
+# EXPORT_MAX_BYTES of input per archive
+app.config['EXPORT_MAX_ITEMS'] = 200
+app.config['EXPORT_MAX_BYTES'] = 1024 * 1024 * 1024
+# Resumable uploads: the upload page sends files to /api/uploads in
+# RESUMABLE_CHUNK_SIZE pieces. Sessions idle for RESUMABLE_SESSION_TTL seconds
+# are deleted with their partial file by a job every RESUMABLE_CLEANUP_INTERVAL.
+# Each session preallocates its full size on disk, so a user may hold at most
+# RESUMABLE_MAX_SESSIONS open sessions reserving RESUMABLE_MAX_RESERVED_BYTES.
+app.config['RESUMABLE_CHUNK_SIZE'] = 4 * 1024 * 1024
+app.config['RESUMABLE_MAX_FILE_SIZE'] = MAX_CONTENT_LENGTH
+app.config['RESUMABLE_MAX_SESSIONS'] = 5
+app.config['RESUMABLE_MAX_RESERVED_BYTES'] = 4 * MAX_CONTENT_LENGTH
+app.config['RESUMABLE_SESSION_TTL'] = 86400
+app.config['RESUMABLE_CLEANUP_INTERVAL'] = 3600
+# Live updates (/events, Server-Sent Events). 'local' delivers within this
+# process; 'sqlite' relays through the events table so every worker process
+# sees every event, each polling it every EVENTS_POLL_INTERVAL seconds.
+app.config['EVENTS_BACKEND'] = 'local'
+app.config['EVENTS_POLL_INTERVAL'] = 0.5
+app.config['EVENTS_RETENTION'] = 3600     # seconds events stay in the table
+app.config['EVENTS_HEARTBEAT'] = 15.0     # keep-alive comment interval
+# Each open stream holds one request thread: keep EVENTS_MAX_CLIENTS below the
+# process's thread count (0 = this process serves no streams; see README)
+app.config['EVENTS_MAX_CLIENTS'] = 200    # open streams per process before 503s
+# Password hashing: new hashes use PASSWORD_HASH_METHOD ('scrypt' or
+# 'pbkdf2_sha256') with the cost settings below; older hashes are upgraded
+# on the next successful login.
+app.config['PASSWORD_HASH_METHOD'] = 'scrypt'
+app.config['PASSWORD_SCRYPT_N'] = 2 ** 14
+app.config['PASSWORD_SCRYPT_R'] = 8
+app.config['PASSWORD_SCRYPT_P'] = 1
+app.config['PASSWORD_PBKDF2_ITERATIONS'] = 600_000
+app.config['PASSWORD_HASH_WORKERS'] = 4   # concurrent KDF computations per process
+app.config['PASSWORD_HASH_QUEUE'] = 32    # logins allowed to wait for a worker
+app.config['PASSWORD_HASH_TIMEOUT'] = 5.0  # seconds to wait for a queue slot
+# Request tracing: per-request SQL/render timings in a Server-Timing header,
+# rolling per-route latency at /internal/metrics (Prometheus text format) and
+# the slowest requests with their SQL at /internal/slow-requests.
+app.config['REQUEST_TRACING'] = True
+app.config['SLOW_REQUEST_MS'] = 500
+app.config['SLOW_REQUEST_LOG_SIZE'] = 50
+app.config['TRACE_MAX_STATEMENTS'] = 200  # statements kept per request
+app.config['METRICS_WINDOW'] = 1024       # recent requests per route behind the quantiles
+app.config['ADMIN_EMAILS'] = []           # accounts allowed to see /internal/*
+app.config['METRICS_TOKEN'] = ''          # bearer token for Prometheus scrapers
+app.config.from_prefixed_env()
+
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(os.path.join(BASE_DIR, 'instance'), exist_ok=True)
+os.makedirs(app.config['THUMBNAIL_FOLDER'], exist_ok=True)
 
 
 # ─── DATABASE ───────────────────────────────────────────────────────────────
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that reports statement and fetch time to its connection's
+    trace. Only handed out while a trace is attached; the checks below cover
+    a cursor that outlives its request's trace."""
+
+    _stmt = -1
+
+    def execute(self, sql, params=()):
+        trace = self.connection.trace
+        if trace is None:
+            return super().execute(sql, params)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._stmt = trace.add(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq):
+        trace = self.connection.trace
+        if trace is None:
+            return super().executemany(sql, seq)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self._stmt = trace.add(sql, time.perf_counter() - start)
+
+    def _fetch(self, method, *args):
+        trace = self.connection.trace
+        if trace is None:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            trace.add_fetch(self._stmt, time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        return self._fetch(super().__next__)
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose statements are timed while `trace` is set (get_db()
+    attaches the current request's RequestTrace). Untraced, it returns plain
+    sqlite3 cursors so execution and row iteration stay in C."""
+
+    trace = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if self.trace is None else TracedCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        if self.trace is None:
+            return super().execute(sql, params)
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        if self.trace is None:
+            return super().executemany(sql, seq)
+        return self.cursor().executemany(sql, seq)
+
+    def commit(self):
+        if self.trace is None:
+            return super().commit()
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.trace.add('COMMIT', time.perf_counter() - start)
+
+
+def connect_db():
+    """Open a new tuned connection. Routes should use get_db() instead."""
+    cfg = app.config
+    conn = sqlite3.connect(cfg['DATABASE'], timeout=cfg['DB_BUSY_TIMEOUT_MS'] / 1000,
+                           check_same_thread=False, factory=TracedConnection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {int(cfg['DB_BUSY_TIMEOUT_MS'])}")
+    conn.execute(f"PRAGMA journal_mode = {cfg['DB_JOURNAL_MODE']}")
+    conn.execute(f"PRAGMA synchronous = {cfg['DB_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA cache_size = {-int(cfg['DB_CACHE_SIZE_KB'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(cfg['DB_MMAP_SIZE'])}")
     return conn
 
 
+_db_pool = []
+_db_pool_lock = threading.Lock()
+
+
+def get_db():
+    """Return this request's connection, borrowing one from the pool on first use.
+
+    The connection is handed back in release_db() when the app context ends,
+    so routes must not close it themselves.
+    """
+    if 'db' not in g:
+        with _db_pool_lock:
+            conn = _db_pool.pop() if _db_pool else None
+        g.db = conn or connect_db()
+        g.db.trace = g.get('trace')
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is None:
+        return
+    conn.trace = None
+    if conn.in_transaction:
+        conn.rollback()
+    with _db_pool_lock:
+        if len(_db_pool) < app.config['DB_POOL_SIZE']:
+            _db_pool.append(conn)
+            return
+    conn.close()
+
+
 def init_db():
-    conn = get_db()
+    conn = connect_db()
     c = conn.cursor()
     c.executescript("""
         CREATE TABLE IF NOT EXISTS users (
@@ -87,63 +377,2280 @@ def init_db():
     conn.close()
 
 
-init_db()
+init_db()
+
+# ─── MIGRATIONS (safe on existing DB) ───────────────────────────────────────
+def column_exists(conn, table, column):
+    return any(row['name'] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+SCHEMA_MIGRATIONS = [
+    # 1: indexes for the hot filters and sorts (home feed, profile, reviews,
+    #    and the child side of every ON DELETE CASCADE foreign key)
+    (1, """
+        CREATE INDEX IF NOT EXISTS idx_resources_privacy_created ON resources(privacy, created_at);
+        CREATE INDEX IF NOT EXISTS idx_resources_college_created ON resources(college, created_at);
+        CREATE INDEX IF NOT EXISTS idx_resources_user_created ON resources(user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_reviews_resource_created ON reviews(resource_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_reviews_user ON reviews(user_id);
+        CREATE INDEX IF NOT EXISTS idx_bookmarks_resource ON bookmarks(resource_id);
+    """),
+    # 2: content-addressed file storage. Identical uploads share one blob;
+    #    refcount follows the resources pointing at it via triggers.
+    #    Legacy uploads keep content_hash NULL and their own file.
+    (2, """
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ALTER TABLE resources ADD COLUMN content_hash TEXT;
+        CREATE INDEX IF NOT EXISTS idx_resources_content_hash ON resources(content_hash);
+
+        CREATE TRIGGER IF NOT EXISTS resources_blob_ai AFTER INSERT ON resources
+        WHEN new.content_hash IS NOT NULL BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = new.content_hash;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resources_blob_ad AFTER DELETE ON resources
+        WHEN old.content_hash IS NOT NULL BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = old.content_hash;
+        END;
+    """),
+    # 3: data version counters behind the response cache. Scope '*' changes
+    #    whenever public data changes; a college name when that college's
+    #    private data changes.
+    (3, """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+    """),
+    # 4: background job queue for post-upload processing, the columns it
+    #    fills in, and the full-text index over the searchable columns plus
+    #    the text extracted from the files (replacing any older index). Its
+    #    triggers keep it in sync, so upload/edit/delete (and cascades) never
+    #    touch it. Existing resources are queued for indexing.
+    (4, """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            resource_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after);
+        CREATE INDEX IF NOT EXISTS idx_jobs_resource ON jobs(resource_id);
+
+        ALTER TABLE resources ADD COLUMN page_count INTEGER;
+        ALTER TABLE resources ADD COLUMN thumbnail TEXT;
+
+        DROP TRIGGER IF EXISTS resources_fts_ai;
+        DROP TRIGGER IF EXISTS resources_fts_au;
+        DROP TRIGGER IF EXISTS resources_fts_ad;
+        DROP TABLE IF EXISTS resources_fts;
+        CREATE VIRTUAL TABLE resources_fts USING fts5(
+            title, subject, tags, description, body,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER resources_fts_ai AFTER INSERT ON resources BEGIN
+            INSERT INTO resources_fts (rowid, title, subject, tags, description, body)
+            VALUES (new.id, new.title, new.subject, new.tags, new.description, '');
+        END;
+        CREATE TRIGGER resources_fts_au
+        AFTER UPDATE OF title, subject, tags, description ON resources BEGIN
+            UPDATE resources_fts
+            SET title=new.title, subject=new.subject, tags=new.tags, description=new.description
+            WHERE rowid = old.id;
+        END;
+        CREATE TRIGGER resources_fts_ad AFTER DELETE ON resources BEGIN
+            DELETE FROM resources_fts WHERE rowid = old.id;
+        END;
+        INSERT INTO resources_fts (rowid, title, subject, tags, description, body)
+        SELECT id, title, subject, tags, description, '' FROM resources;
+
+        INSERT INTO jobs (kind, resource_id)
+        SELECT kind.value, resources.id FROM resources
+        CROSS JOIN (SELECT 'extract_text' AS value UNION ALL SELECT 'page_count'
+                    UNION ALL SELECT 'thumbnail') AS kind;
+    """),
+    # 5: how far each bulk-import manifest has got, committed with its rows
+    (5, """
+        CREATE TABLE IF NOT EXISTS import_progress (
+            manifest TEXT PRIMARY KEY,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    # 6: download log and the time-decayed trending scores rolled up from it.
+    #    trending holds one row per (scope, resource): scope is '*',
+    #    'college:<downloader college>' or 'subject:<subject>'. The global
+    #    score is copied to resources.trending_score for sort=trending.
+    (6, """
+        CREATE TABLE IF NOT EXISTS download_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resource_id INTEGER NOT NULL,
+            college TEXT NOT NULL DEFAULT '',
+            n INTEGER NOT NULL DEFAULT 1,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_download_events_created ON download_events(created_at);
+        CREATE TABLE IF NOT EXISTS trending (
+            scope TEXT NOT NULL,
+            resource_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (scope, resource_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_trending_scope_score ON trending(scope, score DESC);
+        ALTER TABLE resources ADD COLUMN trending_score REAL NOT NULL DEFAULT 0;
+        CREATE INDEX IF NOT EXISTS idx_resources_trending ON resources(trending_score);
+        CREATE INDEX IF NOT EXISTS idx_jobs_kind_status ON jobs(kind, status);
+    """),
+    # 7: precomputed "similar resources" neighbour lists
+    (7, """
+        CREATE TABLE IF NOT EXISTS similar_resources (
+            resource_id INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (resource_id, neighbor_id),
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE,
+            FOREIGN KEY (neighbor_id) REFERENCES resources(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_similar_score ON similar_resources(resource_id, score DESC);
+        CREATE INDEX IF NOT EXISTS idx_similar_neighbor ON similar_resources(neighbor_id);
+    """),
+    # 8: a user's bookmarks newest first, for the /bookmarks listing
+    (8, """
+        CREATE INDEX IF NOT EXISTS idx_bookmarks_user ON bookmarks(user_id, id);
+    """),
+    # 9: resumable upload sessions and the chunks each has received
+    (9, """
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_upload_sessions_user ON upload_sessions(user_id);
+        CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions(updated_at);
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            session_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (session_id, idx),
+            FOREIGN KEY (session_id) REFERENCES upload_sessions(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+    """),
+    # 10: live events relayed between worker processes (EVENTS_BACKEND=sqlite)
+    (10, """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            privacy TEXT NOT NULL,
+            college TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at);
+    """),
+    # 11: visibility-first indexes for the keyset listings. Public rows and a
+    #     college's private rows are each read in (key, id) order from their
+    #     own index (the rowid ends every index), so a page never sorts the
+    #     whole visible set. The average rating becomes a generated column so
+    #     the 'rated' order can be indexed and seeked like the others.
+    (11, """
+        ALTER TABLE resources ADD COLUMN rating_avg REAL
+            GENERATED ALWAYS AS (COALESCE(rating_sum * 1.0 / NULLIF(rating_count, 0), 0)) VIRTUAL;
+        CREATE INDEX IF NOT EXISTS idx_resources_private_created ON resources(privacy, college, created_at);
+        CREATE INDEX IF NOT EXISTS idx_resources_public_popular ON resources(privacy, download_count);
+        CREATE INDEX IF NOT EXISTS idx_resources_private_popular ON resources(privacy, college, download_count);
+        CREATE INDEX IF NOT EXISTS idx_resources_public_rated ON resources(privacy, rating_avg);
+        CREATE INDEX IF NOT EXISTS idx_resources_private_rated ON resources(privacy, college, rating_avg);
+    """),
+    # 12: the same visibility-first indexes for sort=trending. They replace
+    #     the bare trending_score index, which no listing could use for its
+    #     ORDER BY once visibility was filtered first.
+    (12, """
+        DROP INDEX IF EXISTS idx_resources_trending;
+        CREATE INDEX IF NOT EXISTS idx_resources_public_trending ON resources(privacy, trending_score);
+        CREATE INDEX IF NOT EXISTS idx_resources_private_trending ON resources(privacy, college, trending_score);
+    """),
+    # 13: search facet counts per visibility scope ('*' for public rows, a
+    #     college name for its private rows), kept by triggers so unfiltered
+    #     /search counts are a lookup instead of a scan. facet 'total' with
+    #     value '' counts the rows themselves.
+    (13, """
+        CREATE TABLE IF NOT EXISTS facet_counts (
+            scope TEXT NOT NULL,
+            facet TEXT NOT NULL,
+            value TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (scope, facet, value)
+        ) WITHOUT ROWID;
+
+        INSERT INTO facet_counts (scope, facet, value, n)
+        SELECT scope, facet, value, COUNT(*) FROM (
+            SELECT CASE r.privacy WHEN 'public' THEN '*' ELSE r.college END AS scope,
+                   'total' AS facet, '' AS value FROM resources r
+            UNION ALL SELECT CASE r.privacy WHEN 'public' THEN '*' ELSE r.college END,
+                   'subject', r.subject FROM resources r
+            UNION ALL SELECT CASE r.privacy WHEN 'public' THEN '*' ELSE r.college END,
+                   'semester', r.semester FROM resources r
+            UNION ALL SELECT CASE r.privacy WHEN 'public' THEN '*' ELSE r.college END,
+                   'type', r.resource_type FROM resources r
+            UNION ALL SELECT CASE r.privacy WHEN 'public' THEN '*' ELSE r.college END,
+                   'branch', u.branch FROM resources r JOIN users u ON u.id = r.user_id
+            UNION ALL SELECT CASE r.privacy WHEN 'public' THEN '*' ELSE r.college END,
+                   'year_batch', r.year_batch FROM resources r
+        ) WHERE facet = 'total' OR value != ''
+        GROUP BY scope, facet, value;
+
+        CREATE TRIGGER IF NOT EXISTS facet_counts_ai AFTER INSERT ON resources BEGIN
+            INSERT INTO facet_counts (scope, facet, value, n)
+            SELECT CASE new.privacy WHEN 'public' THEN '*' ELSE new.college END, facet, value, 1
+            FROM (SELECT 'total' AS facet, '' AS value
+                  UNION ALL SELECT 'subject', new.subject
+                  UNION ALL SELECT 'semester', new.semester
+                  UNION ALL SELECT 'type', new.resource_type
+                  UNION ALL SELECT 'branch', (SELECT branch FROM users WHERE id = new.user_id)
+                  UNION ALL SELECT 'year_batch', new.year_batch)
+            WHERE facet = 'total' OR value != ''
+            ON CONFLICT (scope, facet, value) DO UPDATE SET n = n + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS facet_counts_ad AFTER DELETE ON resources BEGIN
+            UPDATE facet_counts SET n = n - 1
+            WHERE scope = CASE old.privacy WHEN 'public' THEN '*' ELSE old.college END
+              AND (facet, value) IN (SELECT 'total', ''
+                                     UNION ALL SELECT 'subject', old.subject
+                                     UNION ALL SELECT 'semester', old.semester
+                                     UNION ALL SELECT 'type', old.resource_type
+                                     UNION ALL SELECT 'branch', (SELECT branch FROM users WHERE id = old.user_id)
+                                     UNION ALL SELECT 'year_batch', old.year_batch);
+            DELETE FROM facet_counts
+            WHERE scope = CASE old.privacy WHEN 'public' THEN '*' ELSE old.college END AND n <= 0;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS facet_counts_au
+        AFTER UPDATE OF subject, semester, resource_type, year_batch, privacy, college, user_id ON resources BEGIN
+            UPDATE facet_counts SET n = n - 1
+            WHERE scope = CASE old.privacy WHEN 'public' THEN '*' ELSE old.college END
+              AND (facet, value) IN (SELECT 'total', ''
+                                     UNION ALL SELECT 'subject', old.subject
+                                     UNION ALL SELECT 'semester', old.semester
+                                     UNION ALL SELECT 'type', old.resource_type
+                                     UNION ALL SELECT 'branch', (SELECT branch FROM users WHERE id = old.user_id)
+                                     UNION ALL SELECT 'year_batch', old.year_batch);
+            DELETE FROM facet_counts
+            WHERE scope = CASE old.privacy WHEN 'public' THEN '*' ELSE old.college END AND n <= 0;
+            INSERT INTO facet_counts (scope, facet, value, n)
+            SELECT CASE new.privacy WHEN 'public' THEN '*' ELSE new.college END, facet, value, 1
+            FROM (SELECT 'total' AS facet, '' AS value
+                  UNION ALL SELECT 'subject', new.subject
+                  UNION ALL SELECT 'semester', new.semester
+                  UNION ALL SELECT 'type', new.resource_type
+                  UNION ALL SELECT 'branch', (SELECT branch FROM users WHERE id = new.user_id)
+                  UNION ALL SELECT 'year_batch', new.year_batch)
+            WHERE facet = 'total' OR value != ''
+            ON CONFLICT (scope, facet, value) DO UPDATE SET n = n + 1;
+        END;
+
+        -- The branch facet comes from the uploader's profile
+        CREATE TRIGGER IF NOT EXISTS facet_counts_branch_au AFTER UPDATE OF branch ON users
+        WHEN old.branch IS NOT new.branch BEGIN
+            UPDATE facet_counts SET n = n - moved.n_resources
+            FROM (SELECT CASE privacy WHEN 'public' THEN '*' ELSE college END AS scope, COUNT(*) AS n_resources
+                  FROM resources WHERE user_id = new.id GROUP BY 1) AS moved
+            WHERE facet_counts.scope = moved.scope AND facet = 'branch' AND value = old.branch;
+            DELETE FROM facet_counts WHERE facet = 'branch' AND value = old.branch AND n <= 0;
+            INSERT INTO facet_counts (scope, facet, value, n)
+            SELECT CASE privacy WHEN 'public' THEN '*' ELSE college END, 'branch', new.branch, COUNT(*)
+            FROM resources WHERE user_id = new.id AND new.branch != '' GROUP BY 1
+            ON CONFLICT (scope, facet, value) DO UPDATE SET n = n + excluded.n;
+        END;
+    """),
+    # 14: thumbnails moved from UPLOAD_FOLDER/thumbs (publicly served under
+    #     /static) to THUMBNAIL_FOLDER; the column now holds a bare file name.
+    #     run_migrations moves the files themselves.
+    (14, """
+        UPDATE resources SET thumbnail = substr(thumbnail, 8) WHERE thumbnail LIKE 'thumbs/%';
+    """),
+    # 15: the TF-IDF model of the last full similarity rebuild (IDF per term
+    # and each resource's unit vector as an inverted index), so incremental
+    # refreshes score text exactly like the rebuild; rebuild right away
+    (15, """
+        CREATE TABLE IF NOT EXISTS similar_terms (
+            term TEXT PRIMARY KEY,
+            idf REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS similar_vectors (
+            term TEXT NOT NULL,
+            resource_id INTEGER NOT NULL,
+            weight REAL NOT NULL,
+            PRIMARY KEY (term, resource_id),
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_similar_vectors_resource ON similar_vectors(resource_id);
+        UPDATE jobs SET run_after = CURRENT_TIMESTAMP WHERE kind = 'similar_rebuild' AND status = 'queued';
+    """),
+    # 16: privacy is 'public' or 'private'; anything else was only ever
+    # shown to its own college, so it becomes 'private'
+    (16, """
+        UPDATE resources SET privacy = 'private' WHERE privacy IS NOT 'public' AND privacy IS NOT 'private';
+    """),
+]
+
+
+def run_migrations():
+    conn = connect_db()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS bookmarks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            resource_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, resource_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
+        )
+    """)
+    # Materialized rating aggregate so listings don't run AVG/COUNT per row.
+    # Triggers on reviews keep it current, including cascade deletes.
+    if not column_exists(conn, 'resources', 'rating_sum'):
+        conn.execute("ALTER TABLE resources ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE resources ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0")
+        conn.execute("""
+            UPDATE resources SET
+                rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE resource_id = resources.id),
+                rating_count = (SELECT COUNT(*) FROM reviews WHERE resource_id = resources.id)
+        """)
+    conn.executescript("""
+        CREATE TRIGGER IF NOT EXISTS reviews_stats_ai AFTER INSERT ON reviews BEGIN
+            UPDATE resources SET rating_sum = rating_sum + new.rating, rating_count = rating_count + 1
+            WHERE id = new.resource_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS reviews_stats_au AFTER UPDATE OF rating ON reviews BEGIN
+            UPDATE resources SET rating_sum = rating_sum - old.rating + new.rating
+            WHERE id = new.resource_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS reviews_stats_ad AFTER DELETE ON reviews BEGIN
+            UPDATE resources SET rating_sum = rating_sum - old.rating, rating_count = rating_count - 1
+            WHERE id = old.resource_id;
+        END;
+    """)
+    conn.commit()
+
+    # Versioned steps, tracked in PRAGMA user_version. Append new steps to
+    # SCHEMA_MIGRATIONS; never edit one that has already shipped. Each step
+    # and its version bump commit together, so a failed step leaves nothing
+    # half-applied and simply runs again on the next start.
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, script in SCHEMA_MIGRATIONS:
+        if version > current:
+            try:
+                conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+            except BaseException:
+                conn.rollback()
+                conn.close()
+                raise
+    conn.close()
+
+    # Thumbnails written before migration 14 sit in the public static tree
+    legacy_thumbs = os.path.join(app.config['UPLOAD_FOLDER'], 'thumbs')
+    if os.path.isdir(legacy_thumbs):
+        for name in os.listdir(legacy_thumbs):
+            os.replace(os.path.join(legacy_thumbs, name), os.path.join(app.config['THUMBNAIL_FOLDER'], name))
+        os.rmdir(legacy_thumbs)
+
+run_migrations()
+
+
+# ─── HELPERS ────────────────────────────────────────────────────────────────
+
+def _password_params():
+    """(method, cost parameters) that new hashes are made with."""
+    if app.config['PASSWORD_HASH_METHOD'] == 'pbkdf2_sha256':
+        return 'pbkdf2_sha256', (app.config['PASSWORD_PBKDF2_ITERATIONS'],)
+    return 'scrypt', (app.config['PASSWORD_SCRYPT_N'], app.config['PASSWORD_SCRYPT_R'],
+                      app.config['PASSWORD_SCRYPT_P'])
+
+
+def _kdf(method, params, password, salt):
+    if method == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=32)
+    if method == 'pbkdf2_sha256':
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params[0])
+    raise ValueError(f"unknown password hash method {method!r}")
+
+
+def hash_password(password):
+    """Salted KDF hash stored as method$param...$salt$digest (hex)."""
+    method, params = _password_params()
+    salt = secrets.token_bytes(16)
+    return '$'.join([method, *map(str, params), salt.hex(), _kdf(method, params, password, salt).hex()])
+
+
+def verify_password(stored, password):
+    """Returns (matches, needs_rehash). Bare hex digests are the original
+    unsalted SHA-256 hashes and always need upgrading."""
+    if '$' not in stored:
+        return hmac.compare_digest(stored, hashlib.sha256(password.encode()).hexdigest()), True
+    method, *params, salt, digest = stored.split('$')
+    params = tuple(int(x) for x in params)
+    matches = hmac.compare_digest(bytes.fromhex(digest), _kdf(method, params, password, bytes.fromhex(salt)))
+    return matches, (method, params) != _password_params()
+
+
+class PasswordHasherBusy(Exception):
+    """Every KDF worker and queue slot is taken."""
+
+
+class PasswordHasher:
+    """Runs password hashing on a small bounded thread pool.
+
+    hashlib's scrypt and PBKDF2 release the GIL, so the pool caps how many
+    cores a login storm can take while other requests keep being served.
+    Callers beyond PASSWORD_HASH_QUEUE wait up to PASSWORD_HASH_TIMEOUT and
+    then get PasswordHasherBusy instead of piling up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._dummy = None
+
+    def _executor(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    workers = app.config['PASSWORD_HASH_WORKERS']
+                    self._pool = ThreadPoolExecutor(workers, thread_name_prefix='password-hash')
+                    self._slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE'])
+                    self._pid = os.getpid()
+        return self._pool, self._slots
+
+    def _run(self, fn, *args):
+        pool, slots = self._executor()
+        if not slots.acquire(timeout=app.config['PASSWORD_HASH_TIMEOUT']):
+            raise PasswordHasherBusy()
+        try:
+            return pool.submit(fn, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, password):
+        return self._run(hash_password, password)
+
+    def verify(self, stored, password):
+        return self._run(verify_password, stored, password)
+
+    def verify_missing(self, password):
+        """Spend the same time as a real check when the account doesn't
+        exist, so login timing doesn't reveal which emails are registered."""
+        if self._dummy is None:
+            self._dummy = hash_password(secrets.token_hex(8))
+        self.verify(self._dummy, password)
+        return False, False
+
+
+password_hasher = PasswordHasher()
+
+
+def fts_query(text):
+    """Turn free-form user input into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term, so punctuation in the query can't
+    be parsed as FTS syntax and partial words still match ("algo" -> "algorithms").
+    """
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def blob_relpath(sha256):
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def stage_blob(stream, upload_folder=None):
+    """Stream an upload to a temp file under UPLOAD_FOLDER/tmp in fixed-size
+    chunks, hashing as it goes. Returns (sha256, size, tmp_path); place_blob
+    moves the file into the store.
+    """
+    upload_folder = upload_folder or app.config['UPLOAD_FOLDER']
+    tmp_dir = os.path.join(upload_folder, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return digest.hexdigest(), size, tmp_path
+
+
+def store_blob(stream, upload_folder=None):
+    """stage_blob and place_blob in one go, for tools that have the database
+    to themselves. Returns (sha256, size, relpath); the caller registers the
+    blob row."""
+    sha256, size, tmp_path = stage_blob(stream, upload_folder)
+    return sha256, size, place_blob(tmp_path, sha256, upload_folder)
+
+
+def place_blob(tmp_path, sha256, upload_folder=None):
+    """Move a fully written temp file into the content-addressed store,
+    replacing an identical copy if there is one. Returns the blob's relpath.
+
+    Call it while holding the write lock of the transaction that registers
+    the blob: delete_resource re-checks the blob row under that lock before
+    unlinking, so the file is either still referenced or put back after.
+    """
+    upload_folder = upload_folder or app.config['UPLOAD_FOLDER']
+    relpath = blob_relpath(sha256)
+    final_path = os.path.join(upload_folder, relpath)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(tmp_path, final_path)
+    return relpath
+
+
+def register_blob(conn, sha256, size, relpath):
+    """Make sure a blobs row exists; inserting a resource bumps its refcount."""
+    conn.execute("INSERT OR IGNORE INTO blobs (sha256, path, size) VALUES (?,?,?)",
+                 (sha256, relpath, size))
+
+
+def release_blob(conn, sha256):
+    """Drop a blob row whose last reference is gone. Returns its path to unlink
+    after the surrounding transaction commits, or None while still shared."""
+    row = conn.execute("SELECT path FROM blobs WHERE sha256=?", (sha256,)).fetchone()
+    deleted = conn.execute("DELETE FROM blobs WHERE sha256=? AND refcount <= 0", (sha256,)).rowcount
+    return row['path'] if row and deleted else None
+
+
+RESOURCE_FIELDS = ('title', 'subject', 'semester', 'resource_type', 'year_batch',
+                   'description', 'tags', 'privacy')
+
+
+def clean_resource_fields(data):
+    """Trim the resource form fields out of `data` (a form or manifest row).
+    Returns (fields, error); error is None when the row is usable."""
+    fields = {k: str(data.get(k) or '').strip() for k in RESOURCE_FIELDS}
+    fields['privacy'] = fields['privacy'] or 'public'
+    if not all(fields[k] for k in ('title', 'subject', 'semester', 'resource_type', 'year_batch')):
+        return fields, 'Please fill all required fields.'
+    if fields['privacy'] not in ('public', 'private'):
+        return fields, 'Privacy must be public or private.'
+    return fields, None
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if 'user_id' not in session:
+            flash('Please log in to continue.', 'warning')
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+user_cache = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+def get_current_user():
+    """The logged-in user's row as a dict, looked up at most once per request
+    and served from user_cache across requests (edit_profile() invalidates)."""
+    if 'user_id' not in session:
+        return None
+    if 'user' in g:
+        return g.user
+    user_id = session['user_id']
+    user = user_cache.get(user_id)
+    if user is None:
+        row = get_db().execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+        user = dict(row) if row else None
+        if user:
+            user_cache.set(user_id, user)
+    g.user = user
+    return user
+
+
+# Average rating from the generated rating_avg column (rating_sum/rating_count)
+RATING_COLUMNS = "ROUND(r.rating_avg, 1) AS avg_rating, r.rating_count AS review_count"
+
+# Keyset sort keys. Every key is ordered DESC with r.id DESC as the tiebreak,
+# so a page boundary is just the (key, id) pair of the last row shown.
+SORT_KEYS = {
+    'latest': 'r.created_at',
+    'popular': 'r.download_count',
+    'rated': 'r.rating_avg',
+    'relevance': '-fts.rank',
+    'trending': 'r.trending_score',
+}
+
+# The bookmarks listing can also sort by when each bookmark was made
+BOOKMARK_SORT_KEYS = {
+    'saved': 'b.id',
+    **{name: key for name, key in SORT_KEYS.items() if name != 'relevance'},
+}
+
+
+def encode_cursor(row):
+    raw = json.dumps([row['sort_key'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        key, rid = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return [key, int(rid)]
+    except (ValueError, TypeError):
+        return None
+
+
+def search_filters(args, college, rank=False):
+    """FROM/WHERE clauses for the /search filters in `args`, shared by the
+    result listing and the facet counts. The SQL starts at FROM and ends in
+    the WHERE clause. With rank=True a text query joins the FTS table as
+    `fts` so its bm25 rank can be selected and sorted on. With college=None
+    the visibility filter is left to the caller (see keyset_page).
+    Returns (sql, params, match)."""
+    match = fts_query(args.get('q', '').strip())
+    sql = """
+        FROM resources r
+        JOIN users u ON r.user_id = u.id
+    """
+    params = []
+    if match and rank:
+        # Title hits weigh most, then subject/tags, description, file text
+        sql += """
+        JOIN (SELECT rowid, bm25(resources_fts, 10.0, 5.0, 5.0, 1.0, 0.5) AS rank
+              FROM resources_fts WHERE resources_fts MATCH ?) fts ON fts.rowid = r.id
+        """
+        params.append(match)
+    if college is None:
+        sql += " WHERE 1"
+    else:
+        sql += " WHERE (r.privacy = 'public' OR r.college = ?)"
+        params.append(college)
+    if match and not rank:
+        sql += " AND r.id IN (SELECT rowid FROM resources_fts WHERE resources_fts MATCH ?)"
+        params.append(match)
+
+    for arg, clause, like in [('subject', 'r.subject LIKE ?', True), ('semester', 'r.semester = ?', False),
+                              ('type', 'r.resource_type = ?', False), ('branch', 'u.branch LIKE ?', True),
+                              ('year_batch', 'r.year_batch LIKE ?', True), ('privacy', 'r.privacy = ?', False)]:
+        value = args.get(arg, '')
+        if value:
+            sql += f" AND {clause}"
+            params.append(f"%{value}%" if like else value)
+    return sql, params, match
+
+
+# Search arguments that can be counted, and the column each one filters
+FACET_COLUMNS = {
+    'subject': 'r.subject',
+    'semester': 'r.semester',
+    'type': 'r.resource_type',
+    'branch': 'u.branch',
+    'year_batch': 'r.year_batch',
+}
+FACET_ARGS = ('q', 'privacy', *FACET_COLUMNS)
+
+
+def scope_facet_counts(conn, filters, scope):
+    """[facet, value, n] rows over the filtered search results of one
+    visibility scope: '*' for public rows, else that college's private rows.
+    Cached per scope version, so a public upload doesn't invalidate any
+    college's private counts, nor a private one the shared public counts."""
+    version = conn.execute("SELECT version FROM data_versions WHERE scope = ?", (scope,)).fetchone()
+    cache_key = ('facets', scope, filters, version[0] if version else 0)
+    body = response_cache.get(cache_key)
+    if body is None:
+        from_sql, params, _ = search_filters(dict(filters), None)
+        if scope == '*':
+            from_sql += " AND r.privacy = 'public'"
+        else:
+            from_sql += " AND r.privacy = 'private' AND r.college = ?"
+            params.append(scope)
+        columns = ', '.join(f"{col} AS {name}" for name, col in FACET_COLUMNS.items())
+        groups = ' UNION ALL '.join(
+            f"SELECT '{name}', {name}, COUNT(*) FROM hits WHERE {name} != '' GROUP BY {name}"
+            for name in FACET_COLUMNS)
+        rows = conn.execute(f"""
+            WITH hits AS MATERIALIZED (SELECT {columns} {from_sql})
+            {groups} UNION ALL SELECT 'total', '', COUNT(*) FROM hits
+        """, params).fetchall()
+        body = json.dumps([list(row) for row in rows]).encode()
+        response_cache.set(cache_key, body)
+    return json.loads(body)
+
+
+def search_facets(conn, args, college):
+    """Counts per value of every facet over the filtered search results, as
+    JSON bytes: {"total": n, "facets": {"subject": [[value, count], ...]}}.
+
+    Public rows and the college's private rows are counted separately and
+    added up. Without filters the counts are read from facet_counts;
+    filtered counts come from scope_facet_counts.
+    """
+    filters = tuple((k, args.get(k, '').strip()) for k in FACET_ARGS if args.get(k, '').strip())
+    privacy = dict(filters).get('privacy')
+    scopes = [scope for scope in ('*', college) if not privacy or (privacy == 'public') == (scope == '*')]
+    if filters:
+        rows = [row for scope in scopes for row in scope_facet_counts(conn, filters, scope)]
+    else:
+        rows = conn.execute("SELECT facet, value, n FROM facet_counts WHERE scope IN ('*', ?)",
+                            (college,)).fetchall()
+    counts = {name: Counter() for name in FACET_COLUMNS}
+    total = 0
+    for facet, value, n in rows:
+        if facet == 'total':
+            total += n
+        else:
+            counts[facet][value] += n
+    facets = {name: [[value, n] for value, n in sorted(c.items(), key=lambda kv: (-kv[1], kv[0]))[:FACET_LIMIT]]
+              for name, c in counts.items()}
+    return json.dumps({'total': total, 'facets': facets}).encode()
+
+
+def keyset_page(conn, select_sql, params, sort, after=None, before=None, limit=SEARCH_PAGE_SIZE,
+                sort_keys=SORT_KEYS, college=None):
+    """Fetch one page of a listing query using keyset pagination.
+
+    select_sql is a SELECT over `resources r` that ends in a WHERE clause and
+    has no ORDER BY/LIMIT. Returns (rows, next_cursor, prev_cursor); each row
+    carries an extra `sort_key` column used to build the cursors.
+
+    With `college`, select_sql leaves visibility out and must name r.id `id`
+    (via r.* or `r.id AS id`): the page is merged from the public rows and
+    that college's private rows, each read in key order from its own index,
+    instead of sorting every visible row.
+    """
+    key = sort_keys[sort]
+    select_sql = select_sql.replace('SELECT', f'SELECT {key} AS sort_key,', 1)
+    before_key = decode_cursor(before)
+    after_key = None if before_key else decode_cursor(after)
+    # Walking backwards from a before-cursor reads in ascending order; the
+    # page is flipped into display order below
+    cursor = before_key or after_key or []
+    order = 'ASC' if before_key else 'DESC'
+    seek = f" AND ({key}, r.id) {'>' if before_key else '<'} (?, ?)" if cursor else ''
+
+    if college is None:
+        sql = select_sql + seek + f" ORDER BY {key} {order}, r.id {order} LIMIT ?"
+        params = [*params, *cursor]
+    else:
+        sql = (select_sql + " AND r.privacy = 'public'" + seek + " UNION ALL "
+               + select_sql + " AND r.privacy = 'private' AND r.college = ?" + seek
+               + f" ORDER BY sort_key {order}, id {order} LIMIT ?")
+        params = [*params, *cursor, *params, college, *cursor]
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+
+    if before_key:
+        has_prev = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_next = True
+    else:
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = after_key is not None
+
+    next_cursor = encode_cursor(rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
+def bookmark_page(conn, user, sort='saved', after=None, before=None, limit=SEARCH_PAGE_SIZE):
+    """One keyset page of the resources `user` has bookmarked and can still
+    see, with uploader and rating in the same query."""
+    return keyset_page(conn, f"""
+        SELECT r.*, u.name as uploader_name, u.college as uploader_college,
+               b.created_at as bookmarked_at, {RATING_COLUMNS}
+        FROM bookmarks b
+        JOIN resources r ON r.id = b.resource_id
+        JOIN users u ON u.id = r.user_id
+        WHERE b.user_id = ? AND (r.privacy = 'public' OR r.college = ?)
+    """, [user['id'], user['college']], sort, after=after, before=before, limit=limit,
+        sort_keys=BOOKMARK_SORT_KEYS)
+
+
+# ─── FILE SERVING ───────────────────────────────────────────────────────────
+
+def resource_etag(res, st):
+    """Strong validator for a stored file: its SHA-256 when known, otherwise
+    (legacy uploads) its mtime and size, which never change after upload."""
+    return res['content_hash'] or f"{int(st.st_mtime):x}-{st.st_size:x}"
+
+
+def _byte_ranges(size):
+    """Satisfiable (start, stop) byte ranges of a multi-range request, or None
+    when the request should go through the normal single-range path."""
+    rng = request.range
+    if rng is None or rng.units != 'bytes' or not 1 < len(rng.ranges) <= MAX_BYTE_RANGES:
+        return None
+    ranges = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _multipart_byteranges(path, mimetype, size, ranges):
+    boundary = secrets.token_hex(16)
+    heads = [(f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+              f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode()
+             for start, stop in ranges]
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    length = sum(len(h) for h in heads) + sum(stop - start for start, stop in ranges) + len(tail)
+
+    def generate():
+        with open(path, 'rb') as f:
+            for head, (start, stop) in zip(heads, ranges):
+                yield head
+                f.seek(start)
+                remaining = stop - start
+                while remaining:
+                    chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        yield tail
+
+    resp = app.response_class(generate(), status=206, direct_passthrough=True,
+                              mimetype=f'multipart/byteranges; boundary={boundary}')
+    resp.content_length = length
+    return resp
+
+
+def send_resource_file(res, as_attachment=False):
+    """Serve a resource's file with a strong ETag, Last-Modified, 304s and
+    single or multi-part byte ranges (so PDF viewers can fetch just the pages
+    they show). Access checks are the caller's job."""
+    path = os.path.join(app.config['UPLOAD_FOLDER'], res['filename'])
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    etag = resource_etag(res, st)
+    mimetype = mimetypes.guess_type(res['original_filename'])[0] or 'application/octet-stream'
+
+    offload = app.config['FILE_OFFLOAD']
+    if offload:
+        return offload_resource_file(res, st, etag, mimetype, as_attachment)
+
+    ranges = None
+    if not request.if_none_match.contains(etag):
+        if_range = request.if_range
+        if if_range.etag is None and if_range.date is None or if_range.etag == etag or \
+                (if_range.date and if_range.date.timestamp() >= int(st.st_mtime)):
+            ranges = _byte_ranges(st.st_size)
+    if ranges == []:
+        abort(416)
+    if ranges:
+        resp = _multipart_byteranges(path, mimetype, st.st_size, ranges)
+        resp.set_etag(etag)
+        resp.headers['Last-Modified'] = http_date(st.st_mtime)
+        resp.accept_ranges = 'bytes'
+    else:
+        resp = send_from_directory(app.config['UPLOAD_FOLDER'], res['filename'],
+                                   mimetype=mimetype, as_attachment=as_attachment,
+                                   download_name=res['original_filename'],
+                                   etag=etag, last_modified=st.st_mtime, conditional=True)
+    # Files sit behind access control: let browsers keep them but revalidate
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def offload_resource_file(res, st, etag, mimetype, as_attachment):
+    """Answer with an internal-redirect header; the front proxy streams the
+    bytes (and handles ranges) from UPLOAD_FOLDER."""
+    resp = app.response_class(mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.headers['Last-Modified'] = http_date(st.st_mtime)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    if request.if_none_match.contains(etag):
+        resp.status_code = 304
+        return resp
+    if as_attachment:
+        resp.headers.set('Content-Disposition', 'attachment', filename=res['original_filename'])
+    if app.config['FILE_OFFLOAD'] == 'x-sendfile':
+        resp.headers['X-Sendfile'] = os.path.join(app.config['UPLOAD_FOLDER'], res['filename'])
+    else:
+        resp.headers['X-Accel-Redirect'] = app.config['FILE_OFFLOAD_PREFIX'] + quote(res['filename'])
+    return resp
+
+
+def is_new_download(resp):
+    """A full transfer, or a range request that starts at byte 0. 304s and
+    follow-up range requests for later parts of the file don't count."""
+    if resp.status_code == 304:
+        return False
+    if resp.status_code == 200 and not app.config['FILE_OFFLOAD']:
+        return True
+    # Offloaded (or 206) responses: decide from what the client asked for
+    return request.range is None or any(start == 0 for start, _ in request.range.ranges)
+
+
+class OffloadStandIn:
+    """WSGI middleware that does what nginx/Apache would do with an
+    X-Accel-Redirect or X-Sendfile response. Only for local testing; enable
+    with FILE_OFFLOAD_STANDIN."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if not app.config['FILE_OFFLOAD_STANDIN']:
+            return self.wsgi_app(environ, start_response)
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'], captured['headers'] = status, headers
+            return lambda data: None
+
+        body = self.wsgi_app(environ, capture)
+        headers = dict(captured['headers'])
+        accel, sendfile = headers.get('X-Accel-Redirect'), headers.get('X-Sendfile')
+        if not (accel or sendfile):
+            start_response(captured['status'], captured['headers'])
+            return body
+        if hasattr(body, 'close'):
+            body.close()
+        if accel:
+            rel = accel[len(app.config['FILE_OFFLOAD_PREFIX']):]
+            path = os.path.join(app.config['UPLOAD_FOLDER'], *rel.split('/'))
+        else:
+            path = sendfile
+        resp = wz_send_file(path, environ, mimetype=headers.get('Content-Type'),
+                            etag=headers.get('ETag', '').strip('"') or True, conditional=True)
+        for name in ('Content-Disposition', 'Cache-Control', 'Last-Modified'):
+            if name in headers:
+                resp.headers[name] = headers[name]
+        return resp(environ, start_response)
+
+
+app.wsgi_app = OffloadStandIn(app.wsgi_app)
+
+
+class _ZipSink:
+    """Write-only file object for ZipFile. It has no tell()/seek(), so
+    zipfile writes data descriptors and never goes back. Output is passed to
+    the reading side through a small queue in UPLOAD_CHUNK_SIZE pieces, so a
+    writer that gets ahead of the client blocks instead of buffering."""
+
+    def __init__(self):
+        self.items = queue.Queue(maxsize=4)
+        self.closed = threading.Event()  # set by the reader when it stops
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        if len(self._buf) >= UPLOAD_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buf:
+            self.put('data', bytes(self._buf))
+            self._buf.clear()
+
+    def put(self, kind, value=None):
+        while not self.closed.is_set():
+            try:
+                return self.items.put((kind, value), timeout=1)
+            except queue.Full:
+                pass
+        raise OSError("ZIP stream closed")
+
+
+def stream_zip(entries, on_added=None):
+    """Yield a ZIP archive of `entries` ((arcname, path, key) tuples) while
+    it is being built. A helper thread writes the archive; memory stays at a
+    few queued chunks and nothing of it touches disk. Already-compressed
+    formats are deflated at level 0 rather than stored: a streamed entry has
+    its CRC and sizes in a trailing data descriptor, which many readers only
+    accept for deflated entries. on_added(key) runs after each file."""
+    sink = _ZipSink()
+
+    def build():
+        try:
+            with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+                for arcname, path, key in entries:
+                    if isinstance(path, bytes):
+                        zf.writestr(arcname, path)
+                    else:
+                        level = 0 if arcname.rsplit('.', 1)[-1].lower() in PRECOMPRESSED_EXTENSIONS else None
+                        zf.write(path, arcname, compresslevel=level)
+                    sink.flush()
+                    sink.put('added', key)
+            sink.flush()
+            sink.put('done')
+        except Exception as e:
+            if not sink.closed.is_set():
+                sink.put('error', e)
+
+    threading.Thread(target=build, name='zip-export', daemon=True).start()
+    try:
+        while True:
+            kind, value = sink.items.get()
+            if kind == 'data':
+                yield value
+            elif kind == 'added':
+                if on_added:
+                    on_added(value)
+            elif kind == 'error':
+                raise value
+            else:
+                return
+    finally:
+        sink.closed.set()
+
+
+# ─── STATIC ASSETS ──────────────────────────────────────────────────────────
+
+ASSET_DIST = 'dist'
+COMPRESSIBLE_ASSETS = {'.css', '.js', '.svg', '.json', '.txt'}
+
+
+class AssetPipeline:
+    """Fingerprinted copies of static files, built on first use.
+
+    asset_url('css/main.css') points at dist/css/main.<hash>.css, which never
+    changes, so it can be cached for good; a new build gets a new name. Text
+    assets also get .gz (and, with the brotli package, .br) variants for the
+    static view to pick from. In debug mode sources are re-checked on every
+    call so edits show up without a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manifest = {}   # source name -> (stat signature, dist name)
+
+    def url_name(self, filename):
+        src = os.path.join(app.static_folder, filename)
+        entry = self._manifest.get(filename)
+        if entry and not app.debug:
+            return entry[1]
+        try:
+            st = os.stat(src)
+        except OSError:
+            return filename
+        sig = (st.st_mtime_ns, st.st_size)
+        if entry and entry[0] == sig:
+            return entry[1]
+        with self._lock:
+            try:
+                dist_name = self._build(src, filename)
+            except OSError:
+                app.logger.warning("could not build %s; serving it unversioned", filename, exc_info=True)
+                dist_name = filename
+            self._manifest[filename] = (sig, dist_name)
+        return dist_name
+
+    def _build(self, src, filename):
+        with open(src, 'rb') as f:
+            data = f.read()
+        stem, ext = os.path.splitext(filename)
+        dist_name = f"{ASSET_DIST}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        out = os.path.join(app.static_folder, dist_name)
+        variants = {'': data}
+        if ext in COMPRESSIBLE_ASSETS:
+            variants['.gz'] = gzip.compress(data, 9, mtime=0)
+            if brotli:
+                variants['.br'] = brotli.compress(data, quality=11)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        for suffix, body in variants.items():
+            if os.path.exists(out + suffix):
+                continue
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, out + suffix)
+        return dist_name
+
+    def build_all(self):
+        """Build every CSS/JS file under static/ (for deploy scripts)."""
+        built = {}
+        for root, dirs, files in os.walk(app.static_folder):
+            dirs[:] = [d for d in dirs if d not in (ASSET_DIST, 'uploads')]
+            for name in files:
+                if os.path.splitext(name)[1] in ('.css', '.js'):
+                    filename = os.path.relpath(os.path.join(root, name), app.static_folder).replace(os.sep, '/')
+                    built[filename] = self.url_name(filename)
+        return built
+
+
+asset_pipeline = AssetPipeline()
+
+
+@app.template_global()
+def asset_url(filename):
+    """url_for('static') for a fingerprinted, long-cacheable copy of `filename`."""
+    return url_for('static', filename=asset_pipeline.url_name(filename))
+
+
+def serve_static(filename):
+    """Flask's static view, plus immutable caching and precompressed
+    variants for the fingerprinted files under dist/."""
+    if not filename.startswith(ASSET_DIST + '/'):
+        return app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            resp = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype,
+                                       max_age=app.config['ASSET_MAX_AGE'])
+            resp.content_encoding = encoding
+            break
+    else:
+        resp = send_from_directory(app.static_folder, filename, mimetype=mimetype,
+                                   max_age=app.config['ASSET_MAX_AGE'])
+    resp.vary.add('Accept-Encoding')
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+app.view_functions['static'] = serve_static
+
+
+# ─── DOWNLOAD COUNTERS ──────────────────────────────────────────────────────
+
+class DownloadCounter:
+    """Aggregates download_count increments per resource in memory.
+
+    A background thread writes them in a single transaction every flush
+    interval, or sooner once enough events pile up, and once more at exit.
+    Counts shown on pages are therefore eventually consistent. Each flush
+    also appends one download_events row per (resource, downloader college)
+    for the trending rollup.
+    """
+
+    def __init__(self):
+        self._pending = Counter()
+        self._by_college = Counter()
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, resource_id, n=1, college=''):
+        with self._lock:
+            self._pending[resource_id] += n
+            self._by_college[resource_id, college] += n
+            self._events += n
+            full = self._events >= app.config['DOWNLOAD_FLUSH_MAX_EVENTS']
+            # (Re)start the flusher lazily, and again in a forked worker
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='download-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+                by_college, self._by_college = self._by_college, Counter()
+                self._events = 0
+            if not batch:
+                return
+            now = time.time()
+            try:
+                conn = connect_db()
+                try:
+                    with conn:
+                        conn.executemany(
+                            "UPDATE resources SET download_count = download_count + ? WHERE id = ?",
+                            [(n, rid) for rid, n in batch.items()])
+                        conn.executemany(
+                            "INSERT INTO download_events (resource_id, college, n, created_at) VALUES (?,?,?,?)",
+                            [(rid, college, n, now) for (rid, college), n in by_college.items()])
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                # Keep the counts for the next attempt rather than lose them
+                with self._lock:
+                    self._pending.update(batch)
+                    self._by_college.update(by_college)
+                    self._events += sum(batch.values())
+                app.logger.exception("download counter flush failed")
+
+    def _run(self):
+        while True:
+            self._wake.wait(app.config['DOWNLOAD_FLUSH_INTERVAL'])
+            self._wake.clear()
+            self.flush()
+
+
+download_counter = DownloadCounter()
+atexit.register(download_counter.flush)
+
+
+# ─── RESPONSE CACHE ─────────────────────────────────────────────────────────
+
+def bump_data_version(conn, privacy, college):
+    """Invalidate cached listings that can see a resource with this privacy.
+    Call inside the transaction that changes the resource or its reviews."""
+    scope = '*' if privacy == 'public' else college
+    conn.execute("""
+        INSERT INTO data_versions (scope, version) VALUES (?, 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1
+    """, (scope,))
+
+
+def data_version(conn, college):
+    """Version of everything visible to `college`: public data plus its own."""
+    rows = conn.execute("SELECT scope, version FROM data_versions WHERE scope IN ('*', ?)",
+                        (college,)).fetchall()
+    versions = {row['scope']: row['version'] for row in rows}
+    return f"{versions.get('*', 0)}.{versions.get(college, 0)}"
+
+
+class ResponseCache:
+    """LRU cache of rendered fragments/response bodies capped by total size.
+
+    Keys include the data version, so a write makes old entries unreachable
+    and they age out of the LRU. Values are str or bytes.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, size=None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= self._data.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                    'entries': len(self._data), 'bytes': self._bytes}
+
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'], app.config['RESPONSE_CACHE_TTL'])
+
+
+# ─── BACKGROUND JOBS ────────────────────────────────────────────────────────
+
+PROCESSING_JOBS = ('extract_text', 'page_count', 'thumbnail')
+JOB_HANDLERS = {}
+
+
+class JobSkipped(Exception):
+    """Raised by a handler when there is nothing it can do for this file
+    (unsupported type, optional library missing). Not retried."""
+
+
+class JobInterrupted(Exception):
+    """Raised by a long handler that stopped early because the queue is
+    shutting down. The job goes straight back in the queue."""
+
+
+def job_handler(kind):
+    def register(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return register
+
+
+# Jobs that queue their own next run: kind -> config key of the interval
+PERIODIC_JOBS = {'trending_rollup': 'TRENDING_ROLLUP_INTERVAL', 'similar_rebuild': 'SIMILAR_REBUILD_INTERVAL',
+                 'upload_cleanup': 'RESUMABLE_CLEANUP_INTERVAL'}
+
+
+def schedule_periodic_job(conn, kind, delay=None):
+    """Queue the next run of a periodic job unless one is already waiting."""
+    delay = app.config[PERIODIC_JOBS[kind]] if delay is None else delay
+    conn.execute("""
+        INSERT INTO jobs (kind, max_attempts, run_after)
+        SELECT ?, ?, datetime('now', ?)
+        WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = ? AND status = 'queued')
+    """, (kind, app.config['JOB_MAX_ATTEMPTS'], f'+{int(delay)} seconds', kind))
+
+
+def enqueue_job(conn, kind, resource_id=None, delay=0, unique=False):
+    """Queue a job inside the caller's transaction; call job_queue.notify()
+    after committing so an idle worker picks it up straight away. With
+    unique=True nothing is added while the same job is still queued."""
+    conn.execute(f"""
+        INSERT INTO jobs (kind, resource_id, max_attempts, run_after)
+        SELECT ?, ?, ?, datetime('now', ?)
+        {"WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE resource_id IS ? AND kind = ? AND status = 'queued')"
+         if unique else ""}
+    """, (kind, resource_id, app.config['JOB_MAX_ATTEMPTS'], f'+{int(delay)} seconds',
+           *((resource_id, kind) if unique else ())))
+
+
+class JobQueue:
+    """Worker threads that run jobs from the SQLite `jobs` table.
+
+    Claiming a job is a single UPDATE ... RETURNING, so several threads and
+    worker processes can share the table. Failures are retried with
+    exponential backoff up to max_attempts.
+    """
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._threads = []
+        self.stopping = threading.Event()  # long handlers check this between steps
+
+    def ensure_started(self, workers=None):
+        workers = app.config['JOB_WORKERS'] if workers is None else workers
+        if workers <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                             for i in range(workers)]
+            for t in self._threads:
+                t.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self):
+        """Stop the workers at exit, waiting up to JOB_SHUTDOWN_TIMEOUT for
+        running jobs. A daemon thread still inside a C extension (SciPy in the
+        similarity rebuild) when the interpreter finalizes aborts the process."""
+        if self._pid != os.getpid():
+            return
+        self.stopping.set()
+        self._wake.set()
+        deadline = time.monotonic() + app.config['JOB_SHUTDOWN_TIMEOUT']
+        for t in self._threads:
+            t.join(max(deadline - time.monotonic(), 0))
+
+    def _work(self):
+        """Worker loop. Database errors are logged and retried after a poll
+        interval instead of killing the thread; a finished job whose status
+        update failed keeps its outcome until the update goes through."""
+        conn = connect_db()
+        started, finished = False, None
+        while True:
+            try:
+                if finished is not None:
+                    self.finish(conn, *finished)
+                    finished = None
+                if self.stopping.is_set():
+                    break
+                if not started:
+                    self.requeue_stale(conn)
+                    with conn:
+                        for kind in PERIODIC_JOBS:
+                            schedule_periodic_job(conn, kind, delay=0)
+                    started = True
+                job = self.claim(conn)
+                if job is not None:
+                    finished = (job['id'], *self.run(conn, job))
+                    continue
+            except sqlite3.Error:
+                app.logger.exception("job queue database error")
+                if conn.in_transaction:
+                    conn.rollback()
+                if self.stopping.is_set():
+                    break
+            self._wake.wait(app.config['JOB_POLL_INTERVAL'])
+            self._wake.clear()
+        conn.close()
+
+    def requeue_stale(self, conn):
+        """Give jobs orphaned by a crashed worker another go."""
+        with conn:
+            conn.execute("""
+                UPDATE jobs SET status='queued', updated_at=CURRENT_TIMESTAMP
+                WHERE status='running' AND updated_at < datetime('now', ?)
+            """, (f"-{int(app.config['JOB_STALE_AFTER'])} seconds",))
+
+    def claim(self, conn):
+        with conn:
+            return conn.execute("""
+                UPDATE jobs SET status='running', attempts=attempts+1, updated_at=CURRENT_TIMESTAMP
+                WHERE id = (SELECT id FROM jobs
+                            WHERE status='queued' AND run_after <= CURRENT_TIMESTAMP
+                            ORDER BY run_after, id LIMIT 1)
+                RETURNING id, kind, resource_id, attempts, max_attempts
+            """).fetchone()
+
+    def run(self, conn, job):
+        """Run one claimed job and return its (status, error, delay) outcome."""
+        status, error, delay = 'done', '', 0
+        try:
+            handler = JOB_HANDLERS.get(job['kind'])
+            if handler is None:
+                raise JobSkipped(f"unknown job kind {job['kind']!r}")
+            with app.app_context():
+                handler(conn, job['resource_id'])
+        except JobSkipped as e:
+            status, error = 'skipped', str(e)
+        except JobInterrupted:
+            if conn.in_transaction:
+                conn.rollback()
+            status = 'queued'
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            error = f"{type(e).__name__}: {e}"
+            if job['attempts'] < job['max_attempts']:
+                status, delay = 'queued', app.config['JOB_RETRY_DELAY'] * 2 ** (job['attempts'] - 1)
+            else:
+                status = 'failed'
+                app.logger.exception("job %s (%s) failed", job['id'], job['kind'])
+        return status, error, delay
+
+    def finish(self, conn, job_id, status, error, delay):
+        with conn:
+            conn.execute("""
+                UPDATE jobs SET status=?, last_error=?, run_after=datetime('now', ?),
+                                updated_at=CURRENT_TIMESTAMP
+                WHERE id=?
+            """, (status, error[:500], f'+{int(delay)} seconds', job_id))
+
+
+job_queue = JobQueue()
+atexit.register(job_queue.stop)
+
+
+@app.before_request
+def start_background_workers():
+    job_queue.ensure_started()
+
+
+def _job_resource(conn, resource_id):
+    """(row, path, extension) of a job's resource, or None if it was deleted."""
+    res = conn.execute("SELECT * FROM resources WHERE id=?", (resource_id,)).fetchone()
+    if res is None:
+        return None
+    path = os.path.join(app.config['UPLOAD_FOLDER'], res['filename'])
+    ext = res['original_filename'].rsplit('.', 1)[-1].lower() if '.' in res['original_filename'] else ''
+    return res, path, ext
+
+
+def _ooxml_parts(z, ext):
+    if ext == 'docx':
+        return ['word/document.xml']
+    slides = [n for n in z.namelist() if re.fullmatch(r'ppt/slides/slide\d+\.xml', n)]
+    return sorted(slides, key=lambda n: int(re.search(r'(\d+)\.xml$', n).group(1)))
+
+
+def extract_text(path, ext):
+    limit = app.config['EXTRACT_MAX_CHARS']
+    if ext == 'txt':
+        with open(path, 'rb') as f:
+            return f.read(limit * 4).decode('utf-8', errors='ignore')[:limit]
+    if ext == 'pdf':
+        if pypdf is None:
+            raise JobSkipped("PDF text extraction needs pypdf")
+        parts, total = [], 0
+        for page in pypdf.PdfReader(path).pages:
+            text = page.extract_text() or ''
+            parts.append(text)
+            total += len(text)
+            if total >= limit:
+                break
+        return '\n'.join(parts)[:limit]
+    if ext in ('docx', 'pptx'):
+        parts = []
+        with zipfile.ZipFile(path) as z:
+            for name in _ooxml_parts(z, ext):
+                xml = z.read(name).decode('utf-8', errors='ignore')
+                xml = re.sub(r'</(?:w|a):p>', '\n', xml)
+                parts.append(html.unescape(''.join(re.findall(r'<(?:w|a):t(?:\s[^>]*)?>([^<]*)<', xml))))
+        return '\n'.join(parts)[:limit]
+    raise JobSkipped(f"no text extractor for .{ext} files")
+
+
+def count_pages(path, ext):
+    if ext == 'pdf':
+        if pypdf is not None:
+            return len(pypdf.PdfReader(path).pages)
+        with open(path, 'rb') as f:
+            # Rough fallback: page objects that aren't stored in object streams
+            return len(re.findall(rb'/Type\s*/Page(?![a-zA-Z])', f.read())) or None
+    if ext == 'pptx':
+        with zipfile.ZipFile(path) as z:
+            return len(_ooxml_parts(z, ext))
+    if ext == 'docx':
+        with zipfile.ZipFile(path) as z:
+            if 'docProps/app.xml' in z.namelist():
+                m = re.search(r'<Pages>(\d+)</Pages>', z.read('docProps/app.xml').decode('utf-8', 'ignore'))
+                return int(m.group(1)) if m else None
+        return None
+    if ext in ('png', 'jpg', 'jpeg'):
+        return 1
+    raise JobSkipped(f"no page counter for .{ext} files")
+
+
+def render_thumbnail(path, ext, out_path):
+    width = app.config['THUMBNAIL_WIDTH']
+    if ext in ('png', 'jpg', 'jpeg'):
+        if Image is None:
+            raise JobSkipped("image thumbnails need Pillow")
+        with Image.open(path) as img:
+            img.thumbnail((width, width * 2))
+            img.save(out_path, 'PNG')
+    elif ext == 'pdf':
+        if fitz is None:
+            raise JobSkipped("PDF thumbnails need PyMuPDF")
+        with fitz.open(path) as doc:
+            page = doc[0]
+            zoom = width / page.rect.width
+            page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).save(out_path)
+    else:
+        raise JobSkipped(f"no thumbnailer for .{ext} files")
+
+
+@job_handler('extract_text')
+def extract_text_job(conn, resource_id):
+    found = _job_resource(conn, resource_id)
+    if found:
+        res, path, ext = found
+        text = extract_text(path, ext)
+        with conn:
+            conn.execute("UPDATE resources_fts SET body=? WHERE rowid=?", (text, res['id']))
+            bump_data_version(conn, res['privacy'], res['college'])
+
+
+@job_handler('page_count')
+def page_count_job(conn, resource_id):
+    found = _job_resource(conn, resource_id)
+    if found:
+        res, path, ext = found
+        with conn:
+            conn.execute("UPDATE resources SET page_count=? WHERE id=?", (count_pages(path, ext), res['id']))
+
+
+@job_handler('thumbnail')
+def thumbnail_job(conn, resource_id):
+    found = _job_resource(conn, resource_id)
+    if found:
+        res, path, ext = found
+        # Thumbnails are shared by identical files, like the blobs themselves
+        name = f"{res['content_hash'] or 'r%d' % res['id']}.png"
+        out_path = os.path.join(app.config['THUMBNAIL_FOLDER'], name)
+        if not os.path.exists(out_path):
+            tmp_path = out_path + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                render_thumbnail(path, ext, tmp_path)
+                os.replace(tmp_path, out_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        with conn:
+            conn.execute("UPDATE resources SET thumbnail=? WHERE id=?", (name, res['id']))
+
+
+@job_handler('trending_rollup')
+def trending_rollup_job(conn, resource_id=None):
+    """Recompute every trending score from the download log, then queue the
+    next run. Scores halve every TRENDING_HALF_LIFE_HOURS."""
+    now = time.time()
+    half_life = app.config['TRENDING_HALF_LIFE_HOURS'] * 3600
+    conn.create_function('decay', 1, lambda age: 0.5 ** (age / half_life), deterministic=True)
+    with conn:
+        conn.execute("DELETE FROM download_events WHERE created_at < ?",
+                     (now - app.config['TRENDING_WINDOW_DAYS'] * 86400,))
+        conn.execute("DELETE FROM trending")
+        for scope, group in [("'*'", ''), ("'college:' || e.college", 'e.college, '),
+                             ("'subject:' || r.subject", 'r.subject, ')]:
+            conn.execute(f"""
+                INSERT INTO trending (scope, resource_id, score)
+                SELECT {scope}, e.resource_id, SUM(e.n * decay(? - e.created_at)) AS score
+                FROM download_events e JOIN resources r ON r.id = e.resource_id
+                GROUP BY {group}e.resource_id
+                HAVING score >= 0.01
+            """, (now,))
+        # The privacy term lets the reset seek idx_resources_public_trending
+        conn.execute("""
+            UPDATE resources SET trending_score = 0
+            WHERE privacy IN ('public', 'private') AND trending_score > 0
+        """)
+        conn.execute("""
+            UPDATE resources SET trending_score = t.score
+            FROM trending t WHERE t.scope = '*' AND t.resource_id = resources.id
+        """)
+        # Decay scales every score alike, so rankings only move when there
+        # were new downloads; skip invalidating the caches otherwise
+        recent = conn.execute("SELECT 1 FROM download_events WHERE created_at >= ? LIMIT 1",
+                              (now - app.config['TRENDING_ROLLUP_INTERVAL'] * 2,)).fetchone()
+        if recent:
+            bump_data_version(conn, 'public', None)
+        schedule_periodic_job(conn, 'trending_rollup')
+
+
+def trending_resources(conn, college, subject=None, limit=None):
+    """Top trending resources visible to `college`: by subject if given,
+    else what that college downloads, falling back to the global list.
+    Returns (scope, rows)."""
+    limit = limit or app.config['HOME_TRENDING_SIZE']
+    scopes = [f'subject:{subject}'] if subject else [f'college:{college}', '*']
+    for scope in scopes:
+        rows = conn.execute(f"""
+            SELECT r.*, u.name as uploader_name, u.college as uploader_college, t.score AS trending,
+                   {RATING_COLUMNS}
+            FROM trending t
+            JOIN resources r ON r.id = t.resource_id
+            JOIN users u ON r.user_id = u.id
+            WHERE t.scope = ? AND (r.privacy = 'public' OR r.college = ?)
+            ORDER BY t.score DESC LIMIT ?
+        """, (scope, college, limit)).fetchall()
+        if rows:
+            return scope, rows
+    return scopes[-1], []
+
+
+# ─── RECOMMENDATIONS ────────────────────────────────────────────────────────
+
+STOPWORDS = frozenset('the and for with from this that are was were into unit notes of to in on by an'.split())
+
+
+def text_terms(*parts):
+    return [t for t in re.findall(r'[a-z0-9]{2,}', ' '.join(p or '' for p in parts).lower())
+            if t not in STOPWORDS]
+
+
+def resource_terms(r):
+    return text_terms(r['title'], r['subject'], r['tags'], r['description'])
+
+
+def term_idf(n, df):
+    """Smoothed inverse document frequency of a term in df of n resources."""
+    return math.log((1 + n) / (1 + df)) + 1
+
+
+def tfidf_vector(terms, idf, n):
+    """Unit-length sublinear TF-IDF vector {term: weight}. Terms missing from
+    `idf` (new since the last rebuild) are weighted as if seen once."""
+    vec = {t: (1 + math.log(c)) * idf.get(t, term_idf(n, 1)) for t, c in Counter(terms).items()}
+    norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+    return {t: w / norm for t, w in vec.items()}
+
+
+def store_tfidf_vector(conn, resource_id, terms, n):
+    """Write one resource's TF-IDF vector, weighted with the IDF stored by
+    the last rebuild, to similar_vectors."""
+    idf = dict(conn.execute("SELECT term, idf FROM similar_terms WHERE term IN (SELECT value FROM json_each(?))",
+                            (json.dumps(sorted(set(terms))),)))
+    conn.execute("DELETE FROM similar_vectors WHERE resource_id=?", (resource_id,))
+    conn.executemany("INSERT INTO similar_vectors (term, resource_id, weight) VALUES (?,?,?)",
+                     [(t, resource_id, w) for t, w in tfidf_vector(terms, idf, n).items()])
+
+
+def similar_scores(conn, resource_id):
+    """Neighbour scores for one resource, on the same scale as
+    build_similarity_index: TF-IDF cosine over the stored vectors (this
+    resource's is rewritten first, in case its text changed) plus
+    cosine-normalised co-bookmark and co-review counts."""
+    res = conn.execute("SELECT title, subject, tags, description FROM resources WHERE id=?",
+                       (resource_id,)).fetchone()
+    if res is None:
+        return None
+    cfg = app.config
+    n = conn.execute("SELECT COUNT(*) FROM resources").fetchone()[0]
+    with conn:
+        store_tfidf_vector(conn, resource_id, resource_terms(res), n)
+    scores = Counter()
+    rows = conn.execute("""
+        SELECT b.resource_id, SUM(a.weight * b.weight)
+        FROM similar_vectors a JOIN similar_vectors b ON b.term = a.term AND b.resource_id != a.resource_id
+        WHERE a.resource_id = ?
+        GROUP BY b.resource_id
+    """, (resource_id,)).fetchall()
+    for neighbor, dot in rows:
+        scores[neighbor] += cfg['SIMILAR_TEXT_WEIGHT'] * dot
+    for table, weight in [('bookmarks', cfg['SIMILAR_BOOKMARK_WEIGHT']), ('reviews', cfg['SIMILAR_REVIEW_WEIGHT'])]:
+        rows = conn.execute(f"""
+            SELECT b.resource_id, COUNT(*) AS co,
+                   (SELECT COUNT(*) FROM {table} WHERE resource_id = b.resource_id) AS deg,
+                   (SELECT COUNT(*) FROM {table} WHERE resource_id = ?) AS own
+            FROM {table} a JOIN {table} b ON b.user_id = a.user_id AND b.resource_id != a.resource_id
+            WHERE a.resource_id = ?
+            GROUP BY b.resource_id
+        """, (resource_id, resource_id)).fetchall()
+        for neighbor, co, deg, own in rows:
+            scores[neighbor] += weight * co / (deg * own) ** 0.5
+    return scores
+
+
+def refresh_similar(conn, resource_id, reverse=True):
+    """Recompute one resource's neighbour list. With reverse=True the pair
+    is also written from each neighbour's side, trimmed to SIMILAR_TOP_K."""
+    scores = similar_scores(conn, resource_id)
+    if scores is None:
+        return
+    k = app.config['SIMILAR_TOP_K']
+    top = heapq.nlargest(k, ((n, sc) for n, sc in scores.items() if sc >= SIMILAR_MIN_SCORE), key=lambda item: item[1])
+    with conn:
+        conn.execute("DELETE FROM similar_resources WHERE resource_id=?", (resource_id,))
+        conn.executemany("INSERT INTO similar_resources (resource_id, neighbor_id, score) VALUES (?,?,?)",
+                         [(resource_id, n, sc) for n, sc in top])
+        if reverse:
+            conn.executemany("""
+                INSERT INTO similar_resources (resource_id, neighbor_id, score) VALUES (?,?,?)
+                ON CONFLICT(resource_id, neighbor_id) DO UPDATE SET score=excluded.score
+            """, [(n, resource_id, sc) for n, sc in top])
+            conn.executemany("""
+                DELETE FROM similar_resources WHERE resource_id = ? AND neighbor_id NOT IN (
+                    SELECT neighbor_id FROM similar_resources WHERE resource_id = ?
+                    ORDER BY score DESC LIMIT ?)
+            """, [(n, n, k) for n, _ in top])
+
+
+def _cooccurrence(conn, table, index, n):
+    """Resource x resource cosine similarity of the users who bookmarked or
+    reviewed them, as a sparse matrix with an empty diagonal."""
+    pairs = [(u, index[r]) for u, r in conn.execute(f"SELECT user_id, resource_id FROM {table}") if r in index]
+    if not pairs:
+        return sparse.csr_matrix((n, n))
+    users = {u: i for i, u in enumerate({u for u, _ in pairs})}
+    rows = np.fromiter((users[u] for u, _ in pairs), dtype=np.int64, count=len(pairs))
+    cols = np.fromiter((c for _, c in pairs), dtype=np.int64, count=len(pairs))
+    b = sparse.csr_matrix((np.ones(len(pairs)), (rows, cols)), shape=(len(users), n))
+    b.data[:] = 1.0  # duplicate (user, resource) pairs count once
+    inv = 1 / np.sqrt(np.maximum(np.asarray(b.sum(axis=0)).ravel(), 1))
+    co = (b.T @ b).tocsr()
+    co.setdiag(0)
+    co.eliminate_zeros()
+    return sparse.diags(inv) @ co @ sparse.diags(inv)
+
+
+def build_similarity_index(conn, chunk=512):
+    """Rebuild every neighbour list and the stored TF-IDF model. With
+    NumPy/SciPy this is one vectorized pass (TF-IDF cosine plus co-occurrence
+    matrices, processed in row chunks); without them each resource is
+    refreshed through similar_scores(). Returns the number of resources
+    processed."""
+    rows = conn.execute("SELECT id, title, subject, tags, description FROM resources ORDER BY id").fetchall()
+    n, cfg, k = len(rows), app.config, app.config['SIMILAR_TOP_K']
+    docs = [resource_terms(r) for r in rows]
+    df = Counter(t for terms in docs for t in set(terms))
+    idf = {t: term_idf(n, d) for t, d in df.items()}
+    with conn:
+        conn.execute("DELETE FROM similar_terms")
+        conn.executemany("INSERT INTO similar_terms (term, idf) VALUES (?,?)", idf.items())
+    vectors = [tfidf_vector(terms, idf, n) for terms in docs]
+    for start in range(0, n, chunk):
+        with conn:
+            conn.execute("DELETE FROM similar_vectors WHERE resource_id BETWEEN ? AND ?",
+                         (rows[start]['id'], rows[min(start + chunk, n) - 1]['id']))
+            conn.executemany("INSERT INTO similar_vectors (term, resource_id, weight) VALUES (?,?,?)",
+                             ((t, r['id'], w) for r, vec in zip(rows[start:start + chunk], vectors[start:start + chunk])
+                              for t, w in vec.items()))
+    if np is None:
+        for r in rows:
+            if job_queue.stopping.is_set():
+                raise JobInterrupted
+            refresh_similar(conn, r['id'], reverse=False)
+        return n
+    if n == 0:
+        return 0
+    ids = np.array([r['id'] for r in rows])
+    index = {int(rid): i for i, rid in enumerate(ids)}
+
+    vocab, indices, data, indptr = {}, [], [], [0]
+    for vec in vectors:
+        indices.extend(vocab.setdefault(t, len(vocab)) for t in vec)
+        data.extend(vec.values())
+        indptr.append(len(indices))
+    tfidf = sparse.csr_matrix((np.array(data, dtype=float), indices, indptr), shape=(n, max(len(vocab), 1)))
+    co = (cfg['SIMILAR_BOOKMARK_WEIGHT'] * _cooccurrence(conn, 'bookmarks', index, n)
+          + cfg['SIMILAR_REVIEW_WEIGHT'] * _cooccurrence(conn, 'reviews', index, n)).tocsr()
+
+    for start in range(0, n, chunk):
+        if job_queue.stopping.is_set():
+            raise JobInterrupted
+        stop = min(start + chunk, n)
+        scores = (cfg['SIMILAR_TEXT_WEIGHT'] * (tfidf[start:stop] @ tfidf.T) + co[start:stop]).tocsr()
+        out = []
+        for i in range(stop - start):
+            lo, hi = scores.indptr[i], scores.indptr[i + 1]
+            cols, vals = scores.indices[lo:hi], scores.data[lo:hi]
+            keep = (cols != start + i) & (vals >= SIMILAR_MIN_SCORE)
+            cols, vals = cols[keep], vals[keep]
+            if len(vals) > k:
+                top = np.argpartition(-vals, k)[:k]
+                cols, vals = cols[top], vals[top]
+            rid = int(ids[start + i])
+            out.extend((rid, int(ids[c]), float(v)) for c, v in zip(cols, vals))
+        # One short write transaction per chunk keeps the lock window small
+        with conn:
+            conn.execute("DELETE FROM similar_resources WHERE resource_id BETWEEN ? AND ?",
+                         (int(ids[start]), int(ids[stop - 1])))
+            conn.executemany("INSERT INTO similar_resources (resource_id, neighbor_id, score) VALUES (?,?,?)", out)
+    return n
+
+
+@job_handler('similar')
+def similar_job(conn, resource_id):
+    refresh_similar(conn, resource_id)
+
+
+@job_handler('similar_rebuild')
+def similar_rebuild_job(conn, resource_id=None):
+    build_similarity_index(conn)
+    with conn:
+        schedule_periodic_job(conn, 'similar_rebuild')
+
+
+def similar_resources(conn, resource_id, college, limit=SIMILAR_SHOWN):
+    """The stored neighbours of a resource that `college` may see."""
+    return conn.execute(f"""
+        SELECT r.id, r.title, r.subject, r.semester, r.resource_type, r.original_filename,
+               r.download_count, {RATING_COLUMNS}
+        FROM similar_resources s JOIN resources r ON r.id = s.neighbor_id
+        WHERE s.resource_id = ? AND (r.privacy = 'public' OR r.college = ?)
+        ORDER BY s.score DESC LIMIT ?
+    """, (resource_id, college, limit)).fetchall()
+
+
+# ─── LIVE EVENTS ────────────────────────────────────────────────────────────
+#
+# /events is a Server-Sent Events stream of new uploads and reviews, so pages
+# and the mobile client can stop polling the feed. Routes publish after they
+# commit; each open stream has a bounded queue and only receives events its
+# viewer's college may see.
+
+class EventSubscriber:
+    def __init__(self, college):
+        self.college = college
+        self.queue = queue.Queue(EVENTS_QUEUE_SIZE)
+        self.dropped = False
+
+    def wants(self, event):
+        return event['privacy'] == 'public' or event['college'] == self.college
+
+
+class EventBroker:
+    """In-process pub/sub for live events.
+
+    With EVENTS_BACKEND='sqlite', publish() writes to the events table instead
+    and one thread per process polls it, so a stream in any worker process
+    gets events published by any other. A stream that falls EVENTS_QUEUE_SIZE
+    events behind is closed; the browser reconnects with Last-Event-ID and
+    catches up from the last EVENTS_BACKLOG events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=EVENTS_BACKLOG)
+        self._ids = itertools.count(1)
+        self._wake = threading.Event()
+        self._pid = None
+
+    def publish(self, conn, kind, privacy, college, data):
+        """Announce a committed change. `privacy`/`college` are the
+        resource's and decide who gets the event."""
+        if app.config['EVENTS_BACKEND'] == 'sqlite':
+            now = time.time()
+            conn.execute("DELETE FROM events WHERE created_at < ?", (now - app.config['EVENTS_RETENTION'],))
+            conn.execute("INSERT INTO events (kind, privacy, college, data, created_at) VALUES (?,?,?,?,?)",
+                         (kind, privacy, college, json.dumps(data), now))
+            conn.commit()
+            self._wake.set()
+        else:
+            self._deliver({'id': next(self._ids), 'kind': kind, 'privacy': privacy,
+                           'college': college, 'data': json.dumps(data)})
+
+    def _deliver(self, event):
+        with self._lock:
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.wants(event):
+                try:
+                    sub.queue.put_nowait(event)
+                except queue.Full:
+                    sub.dropped = True
+                    self.unsubscribe(sub)
+
+    def subscribe(self, college, last_event_id=None):
+        """A new subscriber, pre-loaded with anything after last_event_id that
+        is still in the backlog; None when EVENTS_MAX_CLIENTS are connected."""
+        self._ensure_relay()
+        sub = EventSubscriber(college)
+        with self._lock:
+            if len(self._subscribers) >= app.config['EVENTS_MAX_CLIENTS']:
+                return None
+            self._subscribers.add(sub)
+            missed = [e for e in self._recent if last_event_id is not None and e['id'] > last_event_id]
+        for event in missed[-EVENTS_QUEUE_SIZE:]:
+            if sub.wants(event):
+                sub.queue.put_nowait(event)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def stream(self, sub):
+        """SSE body for one subscriber. Blocks its request thread on the
+        queue, with a comment every EVENTS_HEARTBEAT seconds so proxies keep
+        the connection open and a closed client is noticed."""
+        try:
+            yield 'retry: 5000\n\n'
+            while not sub.dropped:
+                try:
+                    event = sub.queue.get(timeout=app.config['EVENTS_HEARTBEAT'])
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"id: {event['id']}\nevent: {event['kind']}\ndata: {event['data']}\n\n"
+        finally:
+            self.unsubscribe(sub)
+
+    def _ensure_relay(self):
+        if app.config['EVENTS_BACKEND'] != 'sqlite' or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._relay, name='event-relay', daemon=True).start()
+
+    def _relay(self):
+        conn = connect_db()
+        last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        while True:
+            try:
+                rows = conn.execute("SELECT id, kind, privacy, college, data FROM events WHERE id > ? ORDER BY id",
+                                    (last,)).fetchall()
+                for row in rows:
+                    last = row['id']
+                    self._deliver(dict(row))
+            except sqlite3.Error:
+                app.logger.exception("event relay failed")
+            self._wake.wait(app.config['EVENTS_POLL_INTERVAL'])
+            self._wake.clear()
+
+
+event_broker = EventBroker()
+
+
+def resource_event(resource_id, fields, user):
+    return {'id': resource_id, 'title': fields['title'], 'subject': fields['subject'],
+            'semester': fields['semester'], 'resource_type': fields['resource_type'],
+            'privacy': fields['privacy'], 'college': user['college'], 'uploader': user['name'],
+            'url': url_for('resource_detail', resource_id=resource_id)}
+
+
+@app.route('/events')
+@login_required
+def event_stream():
+    """Live 'resource' and 'review' events for the viewer (text/event-stream)."""
+    user = get_current_user()
+    sub = event_broker.subscribe(user['college'], request.headers.get('Last-Event-ID', type=int))
+    if sub is None:
+        resp = app.response_class('live updates are busy, try again shortly\n', 503, mimetype='text/plain')
+        resp.headers['Retry-After'] = '30'
+        return resp
+    resp = app.response_class(event_broker.stream(sub), mimetype='text/event-stream')
+    resp.cache_control.no_cache = True
+    resp.headers['X-Accel-Buffering'] = 'no'  # nginx: pass events through unbuffered
+    return resp
+
+
+# ─── REQUEST TRACING & METRICS ─────────────────────────────────────────────
+
+class RequestTrace:
+    """Timings collected for one request: SQL statements and template rendering."""
+
+    __slots__ = ('start', 'db_time', 'queries', 'statements', 'render_time', '_render_depth', '_render_start')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_time = self.render_time = 0.0
+        self.queries = self._render_depth = 0
+        self.statements = []
+        self._render_start = 0.0
+
+    def add(self, sql, elapsed):
+        """Record one statement; returns its index for add_fetch(), or -1
+        once TRACE_MAX_STATEMENTS have been kept."""
+        self.db_time += elapsed
+        self.queries += 1
+        if len(self.statements) < app.config['TRACE_MAX_STATEMENTS']:
+            self.statements.append([sql, elapsed])
+            return len(self.statements) - 1
+        return -1
+
+    def add_fetch(self, index, elapsed):
+        self.db_time += elapsed
+        if index >= 0:
+            self.statements[index][1] += elapsed
+
 
-# ─── MIGRATIONS (safe on existing DB) ───────────────────────────────────────
-def run_migrations():
-    conn = get_db()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS bookmarks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            resource_id INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user_id, resource_id),
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (resource_id) REFERENCES resources(id) ON DELETE CASCADE
-        )
-    """)
-    conn.commit()
-    conn.close()
+class RouteMetrics:
+    """Per-route counters plus the last METRICS_WINDOW latencies, from which
+    quantiles are computed at scrape time."""
 
-run_migrations()
+    def __init__(self, window):
+        self.window = window
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.slow_total = 0
 
+    def observe(self, route, status, total, db, queries, slow=False):
+        with self._lock:
+            self.slow_total += slow
+            m = self._routes.get(route)
+            if m is None:
+                m = self._routes[route] = {'count': 0, 'errors': 0, 'sum': 0.0, 'db_sum': 0.0,
+                                           'queries': 0, 'recent': deque(maxlen=self.window),
+                                           'recent_db': deque(maxlen=self.window)}
+            m['count'] += 1
+            m['errors'] += status >= 500
+            m['sum'] += total
+            m['db_sum'] += db
+            m['queries'] += queries
+            m['recent'].append(total)
+            m['recent_db'].append(db)
 
-# ─── HELPERS ────────────────────────────────────────────────────────────────
+    def snapshot(self):
+        with self._lock:
+            return {route: dict(m, recent=sorted(m['recent']), recent_db=sorted(m['recent_db']))
+                    for route, m in self._routes.items()}
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
+route_metrics = RouteMetrics(app.config['METRICS_WINDOW'])
+slow_requests = deque(maxlen=app.config['SLOW_REQUEST_LOG_SIZE'])
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.before_request
+def start_trace():
+    if app.config['REQUEST_TRACING']:
+        g.trace = RequestTrace()
 
-def login_required(f):
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    trace = g.get('trace')
+    if trace is not None:
+        if trace._render_depth == 0:
+            trace._render_start = time.perf_counter()
+        trace._render_depth += 1
+
+
+@template_rendered.connect_via(app)
+def _render_finished(sender, template, context, **extra):
+    trace = g.get('trace')
+    if trace is not None and trace._render_depth:
+        trace._render_depth -= 1
+        if trace._render_depth == 0:
+            trace.render_time += time.perf_counter() - trace._render_start
+
+
+@app.after_request
+def finish_trace(response):
+    trace = g.pop('trace', None)
+    if trace is None:
+        return response
+    if 'db' in g:
+        g.db.trace = None
+    total = time.perf_counter() - trace.start
+    response.headers['Server-Timing'] = (
+        f'db;dur={trace.db_time * 1000:.1f};desc="{trace.queries} queries", '
+        f'render;dur={trace.render_time * 1000:.1f}, total;dur={total * 1000:.1f}')
+    route = request.url_rule.rule if request.url_rule else '(unmatched)'
+    slow = total * 1000 >= app.config['SLOW_REQUEST_MS']
+    route_metrics.observe(route, response.status_code, total, trace.db_time, trace.queries, slow)
+    if slow:
+        slowest = sorted(trace.statements, key=lambda st: st[1], reverse=True)[:20]
+        slow_requests.append({
+            'at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'method': request.method, 'path': request.full_path.rstrip('?'), 'route': route,
+            'status': response.status_code, 'total_ms': round(total * 1000, 1),
+            'db_ms': round(trace.db_time * 1000, 1), 'render_ms': round(trace.render_time * 1000, 1),
+            'queries': trace.queries,
+            'statements': [{'sql': ' '.join(sql.split())[:500], 'ms': round(t * 1000, 2)} for sql, t in slowest],
+        })
+    return response
+
+
+def admin_required(f):
+    """Admins (ADMIN_EMAILS) or a request carrying METRICS_TOKEN; everyone
+    else gets a 404 so the endpoint isn't advertised."""
     @wraps(f)
     def decorated(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Please log in to continue.', 'warning')
-            return redirect(url_for('login'))
+        token = app.config['METRICS_TOKEN']
+        if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return f(*args, **kwargs)
+        admins = app.config['ADMIN_EMAILS']
+        if isinstance(admins, str):
+            admins = admins.split(',')
+        user = get_current_user()
+        if user is None or user['email'].lower() not in {a.strip().lower() for a in admins}:
+            abort(404)
         return f(*args, **kwargs)
     return decorated
 
 
-def get_current_user():
-    if 'user_id' not in session:
-        return None
-    conn = get_db()
-    user = conn.execute("SELECT * FROM users WHERE id = ?", (session['user_id'],)).fetchone()
-    conn.close()
-    return user
+def _prom_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
 
 
-def get_resource_avg_rating(resource_id, conn):
-    row = conn.execute(
-        "SELECT AVG(rating) as avg, COUNT(*) as cnt FROM reviews WHERE resource_id = ?",
-        (resource_id,)
-    ).fetchone()
-    return round(row['avg'] or 0, 1), row['cnt']
+def _quantile(sorted_values, q):
+    return sorted_values[int(q * (len(sorted_values) - 1))] if sorted_values else 0.0
+
+
+@app.route('/internal/metrics')
+@admin_required
+def internal_metrics():
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_str = ','.join(f'{k}="{_prom_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{suffix}{{{label_str}}} {value:g}" if labels else f"{name}{suffix} {value:g}")
+
+    routes = route_metrics.snapshot()
+    for name, recent, total, help_text in [
+        ('http_request_duration_seconds', 'recent', 'sum', 'Request latency per route.'),
+        ('http_request_db_seconds', 'recent_db', 'db_sum', 'Time spent in SQLite per request.'),
+    ]:
+        samples = []
+        for route, m in sorted(routes.items()):
+            for q in (0.5, 0.95, 0.99):
+                samples.append(('', {'route': route, 'quantile': q}, _quantile(m[recent], q)))
+            samples.append(('_sum', {'route': route}, m[total]))
+            samples.append(('_count', {'route': route}, m['count']))
+        metric(name, 'summary', help_text + f" Quantiles cover the last {route_metrics.window} requests.", samples)
+    metric('http_request_db_queries_total', 'counter', 'SQL statements run by requests.',
+           [('', {'route': r}, m['queries']) for r, m in sorted(routes.items())])
+    metric('http_request_errors_total', 'counter', 'Responses with a 5xx status.',
+           [('', {'route': r}, m['errors']) for r, m in sorted(routes.items())])
+    metric('http_slow_requests_total', 'counter', f"Requests slower than {app.config['SLOW_REQUEST_MS']} ms.",
+           [('', {}, route_metrics.slow_total)])
+
+    stats = response_cache.stats()
+    for key, kind in [('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'),
+                      ('entries', 'gauge'), ('bytes', 'gauge')]:
+        name = f"response_cache_{key}" + ('_total' if kind == 'counter' else '')
+        metric(name, kind, f"Response cache {key}.", [('', {}, stats[key])])
+    metric('user_cache_entries', 'gauge', 'Cached user rows.', [('', {}, len(user_cache))])
+
+    job_counts = dict(get_db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    metric('background_jobs', 'gauge', 'Background jobs by status.',
+           [('', {'status': st}, job_counts.get(st, 0)) for st in ('queued', 'running', 'done', 'failed', 'skipped')])
+
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/internal/slow-requests')
+@admin_required
+def internal_slow_requests():
+    return jsonify(slow_requests=list(reversed(slow_requests)))
 
 
 # ─── AUTH ROUTES ────────────────────────────────────────────────────────────
@@ -177,19 +2684,22 @@ def register():
         existing = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
         if existing:
             flash('Email already registered. Please log in.', 'error')
-            conn.close()
             return render_template('register.html')
 
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            flash('Too many sign-ups right now. Please try again in a moment.', 'error')
+            return render_template('register.html'), 503
         conn.execute(
             "INSERT INTO users (name, email, password_hash, college, branch, semester, bio) VALUES (?,?,?,?,?,?,?)",
-            (name, email, hash_password(password), college, branch, semester, bio)
+            (name, email, password_hash, college, branch, semester, bio)
         )
         conn.commit()
         user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
         session['user_id'] = user['id']
         session['user_name'] = user['name']
         session['user_college'] = user['college']
-        conn.close()
         flash(f'Welcome to Neural Breach, {name}!', 'success')
         return redirect(url_for('home'))
     return render_template('register.html')
@@ -203,12 +2713,21 @@ def login():
         email = request.form.get('email', '').strip().lower()
         password = request.form.get('password', '')
         conn = get_db()
-        user = conn.execute(
-            "SELECT * FROM users WHERE email = ? AND password_hash = ?",
-            (email, hash_password(password))
-        ).fetchone()
-        conn.close()
-        if user:
+        user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        try:
+            if user:
+                matches, needs_rehash = password_hasher.verify(user['password_hash'], password)
+            else:
+                matches, needs_rehash = password_hasher.verify_missing(password)
+            if matches and needs_rehash:
+                conn.execute("UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                             (password_hasher.hash(password), user['id'], user['password_hash']))
+                conn.commit()
+                user_cache.delete(user['id'])
+        except PasswordHasherBusy:
+            flash('Too many sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        if matches:
             session['user_id'] = user['id']
             session['user_name'] = user['name']
             session['user_college'] = user['college']
@@ -232,25 +2751,39 @@ def logout():
 def home():
     user = get_current_user()
     conn = get_db()
-    # Recent public resources + same college private
-    resources = conn.execute("""
-        SELECT r.*, u.name as uploader_name, u.college as uploader_college
-        FROM resources r
-        JOIN users u ON r.user_id = u.id
-        WHERE r.privacy = 'public' OR r.college = ?
-        ORDER BY r.created_at DESC LIMIT 12
-    """, (user['college'],)).fetchall()
+    # The feed only depends on the viewer's college, so its rendered HTML is
+    # shared by everyone there until the next write bumps the data version
+    cache_key = ('home', user['college'], data_version(conn, user['college']))
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        # Recent public resources + same college private. Each half is an index
+        # range read capped at 12 rows, instead of sorting every visible row.
+        resources = conn.execute(f"""
+            SELECT r.*, u.name as uploader_name, u.college as uploader_college, {RATING_COLUMNS}
+            FROM resources r
+            JOIN users u ON r.user_id = u.id
+            WHERE r.id IN (
+                SELECT id FROM (SELECT id FROM resources WHERE privacy = 'public'
+                                ORDER BY created_at DESC LIMIT 12)
+                UNION ALL
+                SELECT id FROM (SELECT id FROM resources WHERE privacy = 'private' AND college = ?
+                                ORDER BY created_at DESC LIMIT 12)
+            )
+            ORDER BY r.created_at DESC LIMIT 12
+        """, (user['college'],)).fetchall()
+        stats = conn.execute("SELECT COUNT(*) as cnt FROM resources WHERE privacy='public'").fetchone()
+        feed_html = render_template('_home_feed.html', resources=resources)
+        scope, trending = trending_resources(conn, user['college'])
+        trending_html = render_template('_home_trending.html', resources=trending,
+                                        college_scope=scope != '*', college=user['college'])
+        cached = (feed_html, stats['cnt'], trending_html)
+        response_cache.set(cache_key, cached, size=len(feed_html) + len(trending_html))
+    feed_html, public_count, trending_html = cached
 
-    result = []
-    for res in resources:
-        avg, cnt = get_resource_avg_rating(res['id'], conn)
-        result.append(dict(res) | {'avg_rating': avg, 'review_count': cnt})
-
-    stats = conn.execute("SELECT COUNT(*) as cnt FROM resources WHERE privacy='public'").fetchone()
     user_uploads = conn.execute("SELECT COUNT(*) as cnt FROM resources WHERE user_id=?", (user['id'],)).fetchone()
-    conn.close()
-    return render_template('home.html', user=user, resources=result,
-                           public_count=stats['cnt'], user_uploads=user_uploads['cnt'])
+    return render_template('home.html', user=user, feed_html=Markup(feed_html),
+                           trending_html=Markup(trending_html),
+                           public_count=public_count, user_uploads=user_uploads['cnt'])
 
 
 @app.route('/upload', methods=['GET', 'POST'])
@@ -258,17 +2791,9 @@ def home():
 def upload():
     user = get_current_user()
     if request.method == 'POST':
-        title = request.form.get('title', '').strip()
-        subject = request.form.get('subject', '').strip()
-        semester = request.form.get('semester', '').strip()
-        resource_type = request.form.get('resource_type', '').strip()
-        year_batch = request.form.get('year_batch', '').strip()
-        description = request.form.get('description', '').strip()
-        tags = request.form.get('tags', '').strip()
-        privacy = request.form.get('privacy', 'public')
-
-        if not all([title, subject, semester, resource_type, year_batch]):
-            flash('Please fill all required fields.', 'error')
+        fields, error = clean_resource_fields(request.form)
+        if error:
+            flash(error, 'error')
             return render_template('upload.html', user=user)
 
         if 'file' not in request.files or request.files['file'].filename == '':
@@ -281,26 +2806,48 @@ def upload():
             return render_template('upload.html', user=user)
 
         original_filename = secure_filename(file.filename)
-        unique_filename = f"{secrets.token_hex(8)}_{original_filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
-        file_size = os.path.getsize(filepath)
+        content_hash, file_size, tmp_path = stage_blob(file.stream)
 
         conn = get_db()
-        conn.execute("""
-            INSERT INTO resources (user_id, title, subject, semester, resource_type,
-            year_batch, description, tags, privacy, college, filename, original_filename, file_size)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """, (user['id'], title, subject, semester, resource_type, year_batch,
-              description, tags, privacy, user['college'], unique_filename,
-              original_filename, file_size))
-        conn.commit()
-        conn.close()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            resource_id = create_resource(conn, user, fields, original_filename, content_hash,
+                                          file_size, tmp_path)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        job_queue.notify()
+        event_broker.publish(conn, 'resource', fields['privacy'], user['college'],
+                             resource_event(resource_id, fields, user))
         flash('Resource uploaded successfully!', 'success')
         return redirect(url_for('home'))
     return render_template('upload.html', user=user)
 
 
+def create_resource(conn, user, fields, original_filename, content_hash, file_size, tmp_path):
+    """Move a staged upload into the blob store, insert its resource and
+    queue its processing, inside the caller's BEGIN IMMEDIATE transaction
+    (see place_blob). Returns the new resource id."""
+    blob_path = place_blob(tmp_path, content_hash)
+    register_blob(conn, content_hash, file_size, blob_path)
+    cur = conn.execute("""
+        INSERT INTO resources (user_id, title, subject, semester, resource_type,
+        year_batch, description, tags, privacy, college, filename, original_filename, file_size,
+        content_hash)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """, (user['id'], *(fields[k] for k in RESOURCE_FIELDS), user['college'], blob_path,
+          original_filename, file_size, content_hash))
+    # Text extraction, thumbnail, page count and neighbours happen after the response
+    for kind in PROCESSING_JOBS:
+        enqueue_job(conn, kind, cur.lastrowid)
+    enqueue_job(conn, 'similar', cur.lastrowid)
+    bump_data_version(conn, fields['privacy'], user['college'])
+    return cur.lastrowid
+
+
 @app.route('/search')
 @login_required
 def search():
@@ -309,59 +2856,39 @@ def search():
     subject = request.args.get('subject', '')
     semester = request.args.get('semester', '')
     resource_type = request.args.get('type', '')
-    branch = request.args.get('branch', '')
-    year_batch = request.args.get('year_batch', '')
-    privacy = request.args.get('privacy', '')
-    sort = request.args.get('sort', 'latest')
 
     conn = get_db()
-    sql = """
-        SELECT r.*, u.name as uploader_name, u.college as uploader_college, u.branch as uploader_branch
-        FROM resources r
-        JOIN users u ON r.user_id = u.id
-        WHERE (r.privacy = 'public' OR r.college = ?)
-    """
-    params = [user['college']]
-
-    if query:
-        sql += " AND (r.title LIKE ? OR r.subject LIKE ? OR r.tags LIKE ? OR r.description LIKE ?)"
-        q = f"%{query}%"
-        params += [q, q, q, q]
-    if subject:
-        sql += " AND r.subject LIKE ?"
-        params.append(f"%{subject}%")
-    if semester:
-        sql += " AND r.semester = ?"
-        params.append(semester)
-    if resource_type:
-        sql += " AND r.resource_type = ?"
-        params.append(resource_type)
-    if branch:
-        sql += " AND u.branch LIKE ?"
-        params.append(f"%{branch}%")
-    if year_batch:
-        sql += " AND r.year_batch LIKE ?"
-        params.append(f"%{year_batch}%")
-    if privacy:
-        sql += " AND r.privacy = ?"
-        params.append(privacy)
-
-    if sort == 'popular':
-        sql += " ORDER BY r.download_count DESC"
-    elif sort == 'rated':
-        sql += " ORDER BY (SELECT AVG(rating) FROM reviews WHERE resource_id=r.id) DESC"
-    else:
-        sql += " ORDER BY r.created_at DESC"
+    from_sql, params, match = search_filters(request.args, None, rank=True)
+    sort = request.args.get('sort') or ('relevance' if match else 'latest')
+    if sort == 'relevance' and not match:
+        sort = 'latest'
+    if sort not in SORT_KEYS:
+        sort = 'latest'
 
-    resources = conn.execute(sql, params).fetchall()
-    result = []
-    for res in resources:
-        avg, cnt = get_resource_avg_rating(res['id'], conn)
-        result.append(dict(res) | {'avg_rating': avg, 'review_count': cnt})
-    conn.close()
-    return render_template('search.html', user=user, resources=result,
+    sql = f"""
+        SELECT r.*, u.name as uploader_name, u.college as uploader_college, u.branch as uploader_branch,
+               {RATING_COLUMNS}
+    """ + from_sql
+    resources, next_cursor, prev_cursor = keyset_page(
+        conn, sql, params, sort, after=request.args.get('after'),
+        before=request.args.get('before'), college=user['college'])
+
+    args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+    next_url = url_for('search', **args, after=next_cursor) if next_cursor else None
+    prev_url = url_for('search', **args, before=prev_cursor) if prev_cursor else None
+
+    counts = json.loads(search_facets(conn, request.args, user['college']))
+    facets = {}
+    for name, values in counts['facets'].items():
+        facet_args = {k: v for k, v in args.items() if k != name}
+        facets[name] = [(value, n, url_for('search', **facet_args, **{name: value})) for value, n in values]
+    return render_template('search.html', user=user, resources=resources,
                            query=query, subject=subject, semester=semester,
-                           resource_type=resource_type, sort=sort)
+                           resource_type=resource_type, sort=sort,
+                           next_url=next_url, prev_url=prev_url,
+                           export_url=url_for('export_resources', source='search', **args),
+                           facets=facets, facet_counts={name: dict(values) for name, values in counts['facets'].items()},
+                           total_results=counts['total'])
 
 
 @app.route('/resource/<int:resource_id>')
@@ -369,8 +2896,9 @@ def search():
 def resource_detail(resource_id):
     user = get_current_user()
     conn = get_db()
-    res = conn.execute("""
-        SELECT r.*, u.name as uploader_name, u.college as uploader_college, u.branch as uploader_branch
+    res = conn.execute(f"""
+        SELECT r.*, u.name as uploader_name, u.college as uploader_college, u.branch as uploader_branch,
+               {RATING_COLUMNS}
         FROM resources r JOIN users u ON r.user_id = u.id
         WHERE r.id = ?
     """, (resource_id,)).fetchone()
@@ -390,7 +2918,6 @@ def resource_detail(resource_id):
         ORDER BY rv.created_at DESC
     """, (resource_id,)).fetchall()
 
-    avg, cnt = get_resource_avg_rating(resource_id, conn)
     user_review = conn.execute(
         "SELECT * FROM reviews WHERE resource_id=? AND user_id=?",
         (resource_id, user['id'])
@@ -399,10 +2926,14 @@ def resource_detail(resource_id):
         "SELECT id FROM bookmarks WHERE user_id=? AND resource_id=?",
         (user['id'], resource_id)
     ).fetchone() is not None
-    conn.close()
+    jobs = conn.execute(
+        "SELECT kind, status, attempts, max_attempts, last_error FROM jobs WHERE resource_id=? AND kind IN (?,?,?) "
+        "ORDER BY id", (resource_id, *PROCESSING_JOBS)
+    ).fetchall()
+    similar = similar_resources(conn, resource_id, user['college'])
     return render_template('resource_detail.html', user=user, resource=dict(res),
-                           reviews=reviews, avg_rating=avg, review_count=cnt,
-                           user_review=user_review, is_bookmarked=is_bookmarked)
+                           reviews=reviews, avg_rating=res['avg_rating'], review_count=res['review_count'],
+                           user_review=user_review, is_bookmarked=is_bookmarked, jobs=jobs, similar=similar)
 
 
 @app.route('/resource/<int:resource_id>/download')
@@ -415,11 +2946,84 @@ def download_resource(resource_id):
         abort(404)
     if res['privacy'] == 'private' and res['college'] != user['college']:
         abort(403)
-    conn.execute("UPDATE resources SET download_count = download_count + 1 WHERE id = ?", (resource_id,))
-    conn.commit()
-    conn.close()
-    return send_from_directory(app.config['UPLOAD_FOLDER'], res['filename'],
-                               as_attachment=True, download_name=res['original_filename'])
+    resp = send_resource_file(res, as_attachment=True)
+    if is_new_download(resp):
+        download_counter.add(resource_id, college=user['college'])
+    return resp
+
+
+@app.route('/export.zip')
+@login_required
+def export_resources():
+    """Download several resources as one ZIP, streamed as it is built.
+
+    Pick them with ?ids=1,2,3, ?source=bookmarks, or ?source=search plus the
+    usual /search filters. Each item gets the same access check as a single
+    download; anything left out is listed in SKIPPED.txt inside the archive.
+    """
+    user = get_current_user()
+    conn = get_db()
+    source = request.args.get('source', 'ids')
+    limit = app.config['EXPORT_MAX_ITEMS']
+    entries, skipped, seen, total = [], [], set(), 0
+    if source == 'bookmarks':
+        rows = conn.execute("""
+            SELECT r.* FROM bookmarks b JOIN resources r ON r.id = b.resource_id
+            WHERE b.user_id = ? ORDER BY b.id DESC LIMIT ?
+        """, (user['id'], limit)).fetchall()
+    elif source == 'search':
+        from_sql, params, _ = search_filters(request.args, user['college'])
+        rows = conn.execute(f"SELECT r.* {from_sql} ORDER BY r.created_at DESC LIMIT ?",
+                            params + [limit]).fetchall()
+    elif source == 'ids':
+        try:
+            ids = [int(i) for i in ','.join(request.args.getlist('ids')).split(',') if i.strip()]
+        except ValueError:
+            abort(400)
+        if not 0 < len(ids) <= limit:
+            abort(400)
+        by_id = {r['id']: r for r in conn.execute(
+            f"SELECT * FROM resources WHERE id IN ({','.join('?' * len(ids))})", ids)}
+        rows = [by_id[i] for i in dict.fromkeys(ids) if i in by_id]
+        skipped += [f"#{i}: not found" for i in dict.fromkeys(ids) if i not in by_id]
+    else:
+        abort(400)
+
+    for res in rows:
+        if res['privacy'] == 'private' and res['college'] != user['college']:
+            skipped.append(f"#{res['id']}: private to {res['college']}")
+            continue
+        path = os.path.join(app.config['UPLOAD_FOLDER'], res['filename'])
+        if not os.path.isfile(path):
+            skipped.append(f"#{res['id']} {res['title']}: file missing")
+            continue
+        if total + res['file_size'] > app.config['EXPORT_MAX_BYTES']:
+            skipped.append(f"#{res['id']} {res['title']}: archive size limit reached")
+            continue
+        total += res['file_size']
+        name = res['original_filename']
+        if name.lower() in seen:
+            stem, dot, ext = name.rpartition('.')
+            name = f"{stem or ext} ({res['id']}){dot}{ext if stem else ''}"
+        seen.add(name.lower())
+        entries.append((name, path, res['id']))
+    if not entries:
+        abort(404)
+    if skipped:
+        entries.append(('SKIPPED.txt', ('\n'.join(skipped) + '\n').encode(), None))
+
+    college = user['college']
+
+    def counted(resource_id):
+        if resource_id is not None:
+            download_counter.add(resource_id, college=college)
+
+    resp = app.response_class(stream_zip(entries, counted), mimetype='application/zip')
+    resp.headers['Content-Disposition'] = \
+        f'attachment; filename="neural-breach-{source}-{datetime.now():%Y%m%d}.zip"'
+    resp.cache_control.private = True
+    resp.cache_control.no_store = True
+    return resp
 
 
 @app.route('/resource/<int:resource_id>/preview')
@@ -428,12 +3032,28 @@ def preview_resource(resource_id):
     user = get_current_user()
     conn = get_db()
     res = conn.execute("SELECT * FROM resources WHERE id = ?", (resource_id,)).fetchone()
-    conn.close()
     if not res:
         abort(404)
     if res['privacy'] == 'private' and res['college'] != user['college']:
         abort(403)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], res['filename'])
+    return send_resource_file(res)
+
+
+@app.route('/resource/<int:resource_id>/thumbnail')
+@login_required
+def resource_thumbnail(resource_id):
+    user = get_current_user()
+    conn = get_db()
+    res = conn.execute("SELECT privacy, college, thumbnail FROM resources WHERE id = ?",
+                       (resource_id,)).fetchone()
+    if not res or not res['thumbnail']:
+        abort(404)
+    if res['privacy'] == 'private' and res['college'] != user['college']:
+        abort(403)
+    resp = send_from_directory(app.config['THUMBNAIL_FOLDER'], res['thumbnail'], mimetype='image/png')
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
 
 
 @app.route('/resource/<int:resource_id>/bookmark', methods=['POST'])
@@ -453,11 +3073,32 @@ def toggle_bookmark(resource_id):
         conn.execute("INSERT INTO bookmarks (user_id, resource_id) VALUES (?,?)",
                      (user['id'], resource_id))
         flash('Resource bookmarked!', 'success')
+    # Bursts of bookmarks on one resource share a single neighbour refresh
+    enqueue_job(conn, 'similar', resource_id, delay=30, unique=True)
     conn.commit()
-    conn.close()
+    job_queue.notify()
+    if request.form.get('from') == 'bookmarks':
+        return redirect(url_for('bookmarks'))
     return redirect(url_for('resource_detail', resource_id=resource_id))
 
 
+@app.route('/bookmarks')
+@login_required
+def bookmarks():
+    user = get_current_user()
+    sort = request.args.get('sort', 'saved')
+    if sort not in BOOKMARK_SORT_KEYS:
+        sort = 'saved'
+    conn = get_db()
+    resources, next_cursor, prev_cursor = bookmark_page(
+        conn, user, sort, after=request.args.get('after'), before=request.args.get('before'))
+    total = conn.execute("SELECT COUNT(*) FROM bookmarks WHERE user_id=?", (user['id'],)).fetchone()[0]
+    next_url = url_for('bookmarks', sort=sort, after=next_cursor) if next_cursor else None
+    prev_url = url_for('bookmarks', sort=sort, before=prev_cursor) if prev_cursor else None
+    return render_template('bookmarks.html', user=user, resources=resources, sort=sort,
+                           total=total, next_url=next_url, prev_url=prev_url)
+
+
 @app.route('/resource/<int:resource_id>/review', methods=['POST'])
 @login_required
 def submit_review(resource_id):
@@ -470,6 +3111,9 @@ def submit_review(resource_id):
         return redirect(url_for('resource_detail', resource_id=resource_id))
 
     conn = get_db()
+    res = conn.execute("SELECT title, privacy, college FROM resources WHERE id=?", (resource_id,)).fetchone()
+    if not res:
+        abort(404)
     existing = conn.execute(
         "SELECT id FROM reviews WHERE resource_id=? AND user_id=?",
         (resource_id, user['id'])
@@ -487,8 +3131,14 @@ def submit_review(resource_id):
             (resource_id, user['id'], rating, comment)
         )
         flash('Review submitted successfully!', 'success')
+    bump_data_version(conn, res['privacy'], res['college'])
+    enqueue_job(conn, 'similar', resource_id, delay=30, unique=True)
     conn.commit()
-    conn.close()
+    job_queue.notify()
+    event_broker.publish(conn, 'review', res['privacy'], res['college'], {
+        'resource_id': resource_id, 'title': res['title'], 'rating': rating, 'comment': comment,
+        'user': user['name'], 'updated': bool(existing),
+        'url': url_for('resource_detail', resource_id=resource_id)})
     return redirect(url_for('resource_detail', resource_id=resource_id))
 
 
@@ -502,23 +3152,22 @@ def edit_resource(resource_id):
     if not res:
         abort(403)
     if request.method == 'POST':
-        title = request.form.get('title', '').strip()
-        subject = request.form.get('subject', '').strip()
-        semester = request.form.get('semester', '').strip()
-        resource_type = request.form.get('resource_type', '').strip()
-        year_batch = request.form.get('year_batch', '').strip()
-        description = request.form.get('description', '').strip()
-        tags = request.form.get('tags', '').strip()
-        privacy = request.form.get('privacy', 'public')
+        fields, error = clean_resource_fields(request.form)
+        if error:
+            flash(error, 'error')
+            return render_template('edit_resource.html', user=user, resource={**dict(res), **fields})
         conn.execute("""
             UPDATE resources SET title=?, subject=?, semester=?, resource_type=?,
             year_batch=?, description=?, tags=?, privacy=? WHERE id=?
-        """, (title, subject, semester, resource_type, year_batch, description, tags, privacy, resource_id))
+        """, (*(fields[k] for k in RESOURCE_FIELDS), resource_id))
+        bump_data_version(conn, res['privacy'], res['college'])
+        if fields['privacy'] != res['privacy']:
+            bump_data_version(conn, fields['privacy'], res['college'])
+        enqueue_job(conn, 'similar', resource_id, unique=True)
         conn.commit()
-        conn.close()
+        job_queue.notify()
         flash('Resource updated successfully!', 'success')
         return redirect(url_for('resource_detail', resource_id=resource_id))
-    conn.close()
     return render_template('edit_resource.html', user=user, resource=dict(res))
 
 
@@ -531,13 +3180,25 @@ def delete_resource(resource_id):
                        (resource_id, user['id'])).fetchone()
     if not res:
         abort(403)
-    # Delete file from disk
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], res['filename'])
-    if os.path.exists(filepath):
-        os.remove(filepath)
     conn.execute("DELETE FROM resources WHERE id=?", (resource_id,))
+    # Shared blobs stay on disk until their last resource is gone
+    unused = release_blob(conn, res['content_hash']) if res['content_hash'] else res['filename']
+    bump_data_version(conn, res['privacy'], res['college'])
     conn.commit()
-    conn.close()
+    if unused:
+        # An upload of the same file may have registered the blob again since;
+        # uploads place their file under the write lock, so check under it too
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not (res['content_hash'] and conn.execute("SELECT 1 FROM blobs WHERE sha256=?",
+                                                         (res['content_hash'],)).fetchone()):
+                for folder, relpath in ((app.config['UPLOAD_FOLDER'], unused),
+                                        (app.config['THUMBNAIL_FOLDER'], res['thumbnail'])):
+                    filepath = os.path.join(folder, relpath or '')
+                    if relpath and os.path.exists(filepath):
+                        os.remove(filepath)
+        finally:
+            conn.commit()
     flash('Resource deleted.', 'info')
     return redirect(url_for('profile'))
 
@@ -547,17 +3208,14 @@ def delete_resource(resource_id):
 def profile():
     user = get_current_user()
     conn = get_db()
-    resources = conn.execute("""
-        SELECT r.*, 
-               (SELECT AVG(rating) FROM reviews WHERE resource_id=r.id) as avg_rating,
-               (SELECT COUNT(*) FROM reviews WHERE resource_id=r.id) as review_count
+    resources = conn.execute(f"""
+        SELECT r.*, {RATING_COLUMNS}
         FROM resources r WHERE r.user_id=?
         ORDER BY r.created_at DESC
     """, (user['id'],)).fetchall()
     total_downloads = conn.execute(
         "SELECT SUM(download_count) as total FROM resources WHERE user_id=?", (user['id'],)
     ).fetchone()['total'] or 0
-    conn.close()
     return render_template('profile.html', user=user, resources=resources,
                            total_downloads=total_downloads)
 
@@ -577,7 +3235,8 @@ def edit_profile():
             UPDATE users SET name=?, college=?, branch=?, semester=?, bio=? WHERE id=?
         """, (name, college, branch, semester, bio, user['id']))
         conn.commit()
-        conn.close()
+        user_cache.delete(user['id'])
+        g.pop('user', None)
         session['user_name'] = name
         session['user_college'] = college
         flash('Profile updated!', 'success')
@@ -585,22 +3244,840 @@ def edit_profile():
     return render_template('edit_profile.html', user=user)
 
 
+# ─── RESUMABLE UPLOADS ──────────────────────────────────────────────────────
+#
+# POST /api/uploads opens a session for a file of known size; the client then
+# PUTs each chunk at its offset (in any order, several at once) and POSTs the
+# resource metadata to /finalize. Chunks go straight from the request stream
+# into a preallocated temp file, so an interrupted transfer only resends the
+# chunks the server has not recorded.
+
+def upload_part_path(session_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'tmp', f'{session_id}.part')
+
+
+def upload_status(conn, sess):
+    chunks = -(-sess['size'] // sess['chunk_size'])
+    received = [row[0] for row in conn.execute(
+        "SELECT idx FROM upload_chunks WHERE session_id = ? ORDER BY idx", (sess['id'],))]
+    return {'id': sess['id'], 'filename': sess['filename'], 'size': sess['size'],
+            'chunk_size': sess['chunk_size'], 'chunks': chunks, 'received': received}
+
+
+def get_upload_session(conn, session_id, user):
+    sess = conn.execute("SELECT * FROM upload_sessions WHERE id = ? AND user_id = ?",
+                        (session_id, user['id'])).fetchone()
+    if not sess or not os.path.exists(upload_part_path(session_id)):
+        abort(404)
+    return sess
+
+
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    """Open a resumable upload. Body: {"filename": "notes.pdf", "size": 12345}."""
+    user = get_current_user()
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    size = data.get('size')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': f'File type not allowed. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'size must be a positive integer'}), 400
+    if size > app.config['RESUMABLE_MAX_FILE_SIZE']:
+        return jsonify({'error': 'File too large.'}), 413
+
+    session_id = secrets.token_urlsafe(16)
+    path = upload_part_path(session_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    now = time.time()
+    conn = get_db()
+    # The write lock makes the quota check and the insert one step, so
+    # parallel requests can't all slip under the limit
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        sessions, reserved = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(size), 0) FROM upload_sessions
+            WHERE user_id = ? AND updated_at >= ?
+        """, (user['id'], now - app.config['RESUMABLE_SESSION_TTL'])).fetchone()
+        if sessions >= app.config['RESUMABLE_MAX_SESSIONS']:
+            conn.rollback()
+            return jsonify({'error': 'Too many unfinished uploads; finish or cancel one first.'}), 429
+        if reserved + size > app.config['RESUMABLE_MAX_RESERVED_BYTES']:
+            conn.rollback()
+            return jsonify({'error': 'Unfinished uploads already reserve too much space; '
+                                     'finish or cancel one first.'}), 429
+        conn.execute("""
+            INSERT INTO upload_sessions (id, user_id, filename, size, chunk_size, created_at, updated_at)
+            VALUES (?,?,?,?,?,?,?)
+        """, (session_id, user['id'], filename, size, app.config['RESUMABLE_CHUNK_SIZE'], now, now))
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    sess = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+    return jsonify(upload_status(conn, sess)), 201
+
+
+@app.route('/api/uploads/<session_id>')
+@login_required
+def upload_session_status(session_id):
+    """Which chunks have arrived, so a client can resume."""
+    conn = get_db()
+    return jsonify(upload_status(conn, get_upload_session(conn, session_id, get_current_user())))
+
+
+@app.route('/api/uploads/<session_id>', methods=['PUT'])
+@login_required
+def upload_chunk(session_id):
+    """Write one chunk at ?offset=N. The body is the raw bytes; an optional
+    X-Chunk-SHA256 header is checked against what was received."""
+    conn = get_db()
+    sess = get_upload_session(conn, session_id, get_current_user())
+    offset = request.args.get('offset', type=int)
+    if offset is None or offset < 0 or offset >= sess['size'] or offset % sess['chunk_size']:
+        return jsonify({'error': 'offset must be a chunk boundary inside the file'}), 400
+    expected = min(sess['chunk_size'], sess['size'] - offset)
+    if request.content_length != expected:
+        return jsonify({'error': f'chunk at offset {offset} must be {expected} bytes'}), 400
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(upload_part_path(session_id), 'r+b') as out:
+        out.seek(offset)
+        while written < expected:
+            data = request.stream.read(min(UPLOAD_CHUNK_SIZE, expected - written))
+            if not data:
+                break
+            digest.update(data)
+            out.write(data)
+            written += len(data)
+    index = offset // sess['chunk_size']
+    checksum = digest.hexdigest()
+    claimed = request.headers.get('X-Chunk-SHA256', '').strip().lower()
+    if written != expected or (claimed and claimed != checksum):
+        # Whatever landed in the file is garbage now; make the client resend
+        conn.execute("DELETE FROM upload_chunks WHERE session_id = ? AND idx = ?", (session_id, index))
+        conn.commit()
+        return jsonify({'error': 'chunk incomplete' if written != expected else 'checksum mismatch',
+                        'chunk': index, 'sha256': checksum}), 422
+    conn.execute("INSERT OR REPLACE INTO upload_chunks (session_id, idx, sha256) VALUES (?,?,?)",
+                 (session_id, index, checksum))
+    conn.execute("UPDATE upload_sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+    conn.commit()
+    return jsonify({'chunk': index, 'sha256': checksum})
+
+
+@app.route('/api/uploads/<session_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(session_id):
+    """Turn a complete upload into a resource. Body: the upload form fields,
+    as JSON or form-encoded."""
+    user = get_current_user()
+    conn = get_db()
+    sess = get_upload_session(conn, session_id, user)
+    fields, error = clean_resource_fields(request.get_json(silent=True) or request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    status = upload_status(conn, sess)
+    if len(status['received']) != status['chunks']:
+        have = set(status['received'])
+        return jsonify({'error': 'upload incomplete',
+                        'missing': [i for i in range(status['chunks']) if i not in have]}), 409
+
+    path = upload_part_path(session_id)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        resource_id = create_resource(conn, user, fields, sess['filename'], content_hash,
+                                      sess['size'], path)
+        conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    job_queue.notify()
+    event_broker.publish(conn, 'resource', fields['privacy'], user['college'],
+                         resource_event(resource_id, fields, user))
+    flash('Resource uploaded successfully!', 'success')
+    return jsonify({'id': resource_id, 'url': url_for('resource_detail', resource_id=resource_id)}), 201
+
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(session_id):
+    conn = get_db()
+    get_upload_session(conn, session_id, get_current_user())
+    conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+    conn.commit()
+    os.remove(upload_part_path(session_id))
+    return '', 204
+
+
+@job_handler('upload_cleanup')
+def upload_cleanup_job(conn, resource_id=None):
+    """Drop upload sessions idle for RESUMABLE_SESSION_TTL and any partial
+    file no session owns any more, sweep staging files (stage_blob temps
+    left by a crashed request or import) untouched for STAGING_MAX_AGE, then
+    queue the next run."""
+    cutoff = time.time() - app.config['RESUMABLE_SESSION_TTL']
+    with conn:
+        conn.execute("DELETE FROM upload_sessions WHERE updated_at < ?", (cutoff,))
+        schedule_periodic_job(conn, 'upload_cleanup')
+    live = {row[0] for row in conn.execute("SELECT id FROM upload_sessions")}
+    tmp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'tmp')
+    for name in os.listdir(tmp_dir) if os.path.isdir(tmp_dir) else []:
+        session_id, ext = os.path.splitext(name)
+        path = os.path.join(tmp_dir, name)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            continue  # placed or removed meanwhile
+        # A new session's .part exists briefly before its row is committed
+        orphaned = (session_id not in live and age > 60) if ext == '.part' else age > STAGING_MAX_AGE
+        if orphaned and os.path.isfile(path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
 # ─── API ENDPOINTS ──────────────────────────────────────────────────────────
 
+@app.route('/api/search/facets')
+@login_required
+def api_search_facets():
+    """Facet counts for the /search filters given as query arguments."""
+    user = get_current_user()
+    resp = app.response_class(search_facets(get_db(), request.args, user['college']),
+                              mimetype='application/json')
+    resp.cache_control.private = True
+    return resp
+
+
+@app.route('/api/trending')
+@login_required
+def api_trending():
+    """Trending resources for the viewer's college, or for ?subject=."""
+    user = get_current_user()
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    scope, rows = trending_resources(get_db(), user['college'], request.args.get('subject') or None, limit)
+    return jsonify({'scope': scope, 'resources': [{
+        'id': r['id'], 'title': r['title'], 'subject': r['subject'], 'semester': r['semester'],
+        'resource_type': r['resource_type'], 'privacy': r['privacy'], 'download_count': r['download_count'],
+        'created_at': r['created_at'], 'uploader': r['uploader_name'], 'college': r['uploader_college'],
+        'avg_rating': r['avg_rating'], 'review_count': r['review_count'], 'trending_score': round(r['trending'], 3),
+    } for r in rows]})
+
+
+@app.route('/api/bookmarks')
+@login_required
+def api_bookmarks():
+    """The viewer's bookmarks, keyset-paginated like /api/resources."""
+    user = get_current_user()
+    sort = request.args.get('sort', 'saved')
+    if sort not in BOOKMARK_SORT_KEYS:
+        abort(400)
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    rows, next_cursor, prev_cursor = bookmark_page(
+        get_db(), user, sort, after=request.args.get('after'),
+        before=request.args.get('before'), limit=limit)
+    return jsonify({'resources': [{
+        'id': r['id'], 'title': r['title'], 'subject': r['subject'], 'semester': r['semester'],
+        'resource_type': r['resource_type'], 'privacy': r['privacy'], 'download_count': r['download_count'],
+        'created_at': r['created_at'], 'uploader': r['uploader_name'], 'college': r['uploader_college'],
+        'avg_rating': r['avg_rating'], 'review_count': r['review_count'], 'bookmarked_at': r['bookmarked_at'],
+    } for r in rows], 'next_cursor': next_cursor, 'prev_cursor': prev_cursor})
+
+
+@app.route('/api/bookmarks', methods=['POST'])
+@login_required
+def api_bookmarks_batch():
+    """Apply a batch of bookmark changes in one transaction.
+
+    Body: {"ops": [{"resource_id": 7, "action": "add" | "remove" | "toggle"}, ...]}.
+    Ops apply in order, so a resource toggled twice ends where it started.
+    Responds with the final state of every resource named in the batch.
+    """
+    user = get_current_user()
+    ops = (request.get_json(silent=True) or {}).get('ops')
+    if not isinstance(ops, list) or not 0 < len(ops) <= BOOKMARK_BATCH_MAX:
+        return jsonify({'error': f'ops must be a list of 1 to {BOOKMARK_BATCH_MAX} operations'}), 400
+    parsed = []
+    for op in ops:
+        try:
+            resource_id, action = int(op['resource_id']), op['action']
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'each op needs an integer resource_id and an action'}), 400
+        if action not in ('add', 'remove', 'toggle'):
+            return jsonify({'error': f'unknown action {action!r}'}), 400
+        parsed.append((resource_id, action))
+
+    conn = get_db()
+    ids = sorted({rid for rid, _ in parsed})
+    marks = ','.join('?' * len(ids))
+    # Removing is always allowed; adding needs a resource the viewer can see
+    wanted = sorted({rid for rid, action in parsed if action != 'remove'})
+    if wanted:
+        visible = {row[0] for row in conn.execute(f"""
+            SELECT id FROM resources
+            WHERE id IN ({','.join('?' * len(wanted))}) AND (privacy = 'public' OR college = ?)
+        """, wanted + [user['college']])}
+        missing = [rid for rid in wanted if rid not in visible]
+        if missing:
+            return jsonify({'error': 'resource not found', 'missing': missing}), 404
+
+    before = {row[0] for row in conn.execute(
+        f"SELECT resource_id FROM bookmarks WHERE user_id = ? AND resource_id IN ({marks})",
+        [user['id']] + ids)}
+    state = set(before)
+    for rid, action in parsed:
+        if action == 'add' or (action == 'toggle' and rid not in state):
+            state.add(rid)
+        else:
+            state.discard(rid)
+    added, removed = sorted(state - before), sorted(before - state)
+    conn.executemany("INSERT OR IGNORE INTO bookmarks (user_id, resource_id) VALUES (?,?)",
+                     [(user['id'], rid) for rid in added])
+    conn.executemany("DELETE FROM bookmarks WHERE user_id = ? AND resource_id = ?",
+                     [(user['id'], rid) for rid in removed])
+    for rid in added + removed:
+        enqueue_job(conn, 'similar', rid, delay=30, unique=True)
+    conn.commit()
+    if added or removed:
+        job_queue.notify()
+    return jsonify({'bookmarks': {str(rid): rid in state for rid in ids},
+                    'added': added, 'removed': removed})
+
+
 @app.route('/api/resources')
 @login_required
 def api_resources():
     user = get_current_user()
+    sort = request.args.get('sort', 'latest')
+    if sort not in SORT_KEYS or sort == 'relevance':
+        abort(400)
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
     conn = get_db()
-    resources = conn.execute("""
-        SELECT r.id, r.title, r.subject, r.semester, r.resource_type, r.privacy,
-               r.download_count, r.created_at, u.name as uploader, u.college
-        FROM resources r JOIN users u ON r.user_id=u.id
-        WHERE r.privacy='public' OR r.college=?
-        ORDER BY r.created_at DESC LIMIT 20
-    """, (user['college'],)).fetchall()
-    conn.close()
-    return jsonify([dict(r) for r in resources])
+    cache_key = ('api_resources', user['college'], tuple(sorted(request.args.items())),
+                 data_version(conn, user['college']))
+    body = response_cache.get(cache_key)
+    if body is None:
+        resources, next_cursor, prev_cursor = keyset_page(conn, f"""
+            SELECT r.id AS id, r.title, r.subject, r.semester, r.resource_type, r.privacy,
+                   r.download_count, r.created_at, u.name as uploader, u.college, {RATING_COLUMNS}
+            FROM resources r JOIN users u ON r.user_id=u.id
+            WHERE 1
+        """, [], sort, after=request.args.get('after'),
+            before=request.args.get('before'), limit=limit, college=user['college'])
+        items = []
+        for r in resources:
+            item = dict(r)
+            del item['sort_key']
+            items.append(item)
+        body = jsonify({'resources': items, 'next_cursor': next_cursor,
+                        'prev_cursor': prev_cursor}).get_data()
+        response_cache.set(cache_key, body)
+        status = 'MISS'
+    else:
+        status = 'HIT'
+    resp = app.response_class(body, mimetype='application/json')
+    resp.headers['X-Cache'] = status
+    return resp
+
+
+# ─── API v1 ─────────────────────────────────────────────────────────────────
+#
+# Read-only JSON for the mobile client. SQLite renders each row with
+# json_object() and the rows are joined into the body as text, so no dicts
+# are built per row; ?fields= picks which keys go in. Responses carry a weak
+# ETag from the viewer's data version, so an unchanged poll gets a 304
+# without running the listing query.
+
+API_V1_RESOURCE_FIELDS = {
+    'id': 'r.id',
+    'title': 'r.title',
+    'subject': 'r.subject',
+    'semester': 'r.semester',
+    'resource_type': 'r.resource_type',
+    'year_batch': 'r.year_batch',
+    'description': 'r.description',
+    'tags': 'r.tags',
+    'privacy': 'r.privacy',
+    'college': 'r.college',
+    'uploader': 'u.name',
+    'filename': 'r.original_filename',
+    'file_size': 'r.file_size',
+    'page_count': 'r.page_count',
+    'download_count': 'r.download_count',
+    'avg_rating': 'ROUND(r.rating_avg, 1)',
+    'review_count': 'r.rating_count',
+    'trending_score': 'ROUND(r.trending_score, 3)',
+    'created_at': 'r.created_at',
+}
+API_V1_DEFAULT_FIELDS = ('id', 'title', 'subject', 'semester', 'resource_type', 'privacy',
+                         'download_count', 'created_at', 'uploader', 'college',
+                         'avg_rating', 'review_count')
+API_V1_REVIEW_FIELDS = {
+    'id': 'rv.id',
+    'rating': 'rv.rating',
+    'comment': 'rv.comment',
+    'user': 'u.name',
+    'created_at': 'rv.created_at',
+}
+
+
+def api_error(message, status=400):
+    abort(app.response_class(json.dumps({'error': message}), status, mimetype='application/json'))
+
+
+def api_fields(available, default=None):
+    """The json_object(...) expression for the ?fields= selection."""
+    requested = request.args.get('fields')
+    names = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(default or available)
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        api_error(f"unknown fields: {', '.join(unknown)}; choose from {', '.join(available)}")
+    return 'json_object(' + ', '.join(f"'{name}', {available[name]}" for name in dict.fromkeys(names)) + ')'
+
+
+def api_limit():
+    return min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+
+
+def api_v1_response(conn, college, build):
+    """Serve the JSON text from build() with a weak ETag, or a 304 when the
+    client already has it. The tag covers the viewer's data version, the
+    request, and a RESPONSE_CACHE_TTL time bucket, so download counts (which
+    don't bump the version) go no staler than cached pages do. Bodies are
+    shared through response_cache between viewers from the same college.
+    """
+    bucket = int(time.time() // app.config['RESPONSE_CACHE_TTL'])
+    key = json.dumps([college, request.path, sorted(request.args.items(multi=True))])
+    etag = (f"{data_version(conn, college)}.{bucket}."
+            f"{hashlib.blake2b(key.encode(), digest_size=8).hexdigest()}")
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+    else:
+        body = response_cache.get(('api_v1', etag))
+        if body is None:
+            body = build()
+            response_cache.set(('api_v1', etag), body)
+            status = 'MISS'
+        else:
+            status = 'HIT'
+        resp = app.response_class(body, mimetype='application/json')
+        resp.headers['X-Cache'] = status
+    resp.set_etag(etag, weak=True)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def api_page_body(name, docs, next_cursor, prev_cursor=None):
+    return (f'{{"{name}":[' + ','.join(docs) +
+            f'],"next_cursor":{json.dumps(next_cursor)},"prev_cursor":{json.dumps(prev_cursor)}}}')
+
+
+def api_v1_listing(require_query=False):
+    user = get_current_user()
+    conn = get_db()
+    doc = api_fields(API_V1_RESOURCE_FIELDS, API_V1_DEFAULT_FIELDS)
+    from_sql, params, match = search_filters(request.args, None, rank=True)
+    if require_query and not match:
+        api_error('q is required')
+    sort = request.args.get('sort') or ('relevance' if match else 'latest')
+    if sort not in SORT_KEYS or (sort == 'relevance' and not match):
+        api_error(f"sort must be one of {', '.join(k for k in SORT_KEYS if match or k != 'relevance')}")
+    limit = api_limit()
+
+    def build():
+        # Page over ids first: when the ORDER BY needs a sort, SQLite would
+        # otherwise render a document for every matching row, not just the page
+        rows, next_cursor, prev_cursor = keyset_page(
+            conn, "SELECT r.id AS id " + from_sql, params, sort, after=request.args.get('after'),
+            before=request.args.get('before'), limit=limit, college=user['college'])
+        ids = [row['id'] for row in rows]
+        docs = {row[0]: row[1] for row in conn.execute(f"""
+            SELECT r.id, {doc} FROM resources r JOIN users u ON u.id = r.user_id
+            WHERE r.id IN ({','.join('?' * len(ids))})
+        """, ids)} if ids else {}
+        return api_page_body('resources', [docs[i] for i in ids], next_cursor, prev_cursor)
+    return api_v1_response(conn, user['college'], build)
+
+
+@app.route('/api/v1/resources')
+@login_required
+def api_v1_resources():
+    """Resources visible to the viewer; takes the /search filters, sort,
+    after/before cursors, limit and fields."""
+    return api_v1_listing()
+
+
+@app.route('/api/v1/search')
+@login_required
+def api_v1_search():
+    """Full-text search (q=), ranked by relevance unless sort= says otherwise."""
+    return api_v1_listing(require_query=True)
+
+
+@app.route('/api/v1/resources/<int:resource_id>')
+@login_required
+def api_v1_resource(resource_id):
+    user = get_current_user()
+    conn = get_db()
+    doc = api_fields(API_V1_RESOURCE_FIELDS)
+
+    def build():
+        row = conn.execute(f"""
+            SELECT {doc} AS doc FROM resources r JOIN users u ON u.id = r.user_id
+            WHERE r.id = ? AND (r.privacy = 'public' OR r.college = ?)
+        """, (resource_id, user['college'])).fetchone()
+        if not row:
+            api_error('resource not found', 404)
+        return row['doc']
+    return api_v1_response(conn, user['college'], build)
+
+
+@app.route('/api/v1/resources/<int:resource_id>/reviews')
+@login_required
+def api_v1_reviews(resource_id):
+    """Reviews newest first, paged with ?after= like the listings."""
+    user = get_current_user()
+    conn = get_db()
+    doc = api_fields(API_V1_REVIEW_FIELDS)
+    limit = api_limit()
+    after = decode_cursor(request.args.get('after'))
+
+    def build():
+        if not conn.execute("SELECT 1 FROM resources WHERE id = ? AND (privacy = 'public' OR college = ?)",
+                            (resource_id, user['college'])).fetchone():
+            api_error('resource not found', 404)
+        sql = f"""
+            SELECT rv.id, rv.created_at AS sort_key, {doc} AS doc
+            FROM reviews rv JOIN users u ON u.id = rv.user_id
+            WHERE rv.resource_id = ?
+        """
+        params = [resource_id]
+        if after:
+            sql += " AND (rv.created_at, rv.id) < (?, ?)"
+            params += after
+        rows = conn.execute(sql + " ORDER BY rv.created_at DESC, rv.id DESC LIMIT ?",
+                            params + [limit + 1]).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return api_page_body('reviews', [row['doc'] for row in rows[:limit]], next_cursor)
+    return api_v1_response(conn, user['college'], build)
+
+
+# ─── MAINTENANCE COMMANDS ───────────────────────────────────────────────────
+
+# Routes whose every SELECT must be answered by an index (run with
+# `flask check-query-plans`; a SCAN of a real table fails the check)
+QUERY_PLAN_ROUTES = [
+    '/home',
+    '/profile',
+    '/resource/{resource_id}',
+    '/search?semester=3&type=Notes',
+    '/search?q=notes&subject=data',
+    '/api/search/facets?q=notes',
+    '/api/trending',
+    '/api/trending?subject=Data+Structures',
+    '/bookmarks?sort=rated',
+    '/api/v1/resources?sort=rated&fields=id,title,avg_rating',
+    '/api/v1/search?q=trees',
+    '/api/v1/resources/{resource_id}',
+]
+
+# Paginated listings: besides avoiding table scans, every page must be read
+# in index order, so a USE TEMP B-TREE FOR ORDER BY in any of their
+# statements fails the check too
+SORTED_PLAN_ROUTES = [
+    *(f'{path}?sort={sort}' for path in ('/search', '/api/resources', '/api/v1/resources')
+      for sort in ('latest', 'popular', 'rated', 'trending')),
+    '/search?semester=3',
+    '/bookmarks',
+    '/api/bookmarks',
+    '/api/v1/resources/{resource_id}/reviews',
+]
+
+
+def query_plan_problems(conn, sql, sorted_route=False):
+    """Return the EXPLAIN QUERY PLAN lines of `sql` that scan a whole table
+    (scans of its own WITH tables are fine), plus any temp B-tree sort for
+    ORDER BY when `sorted_route`."""
+    ctes = set(re.findall(r'(\w+) AS (?:NOT )?(?:MATERIALIZED )?\(', sql))
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    return [line for line in plan
+            if (re.match(r'SCAN (?!\(|CONSTANT ROW)', line) and 'VIRTUAL TABLE' not in line
+                and line.split()[1] not in ctes)
+            or (sorted_route and 'TEMP B-TREE FOR' in line and 'ORDER BY' in line)]
+
+
+@app.cli.command('run-jobs')
+@click.option('--workers', default=2, show_default=True, help='Worker threads to run.')
+def run_jobs_command(workers):
+    """Run background jobs in this process until interrupted."""
+    job_queue.ensure_started(workers)
+    click.echo(f"running {workers} job workers against {app.config['DATABASE']}")
+    while True:
+        time.sleep(3600)
+
+
+def read_manifest(path):
+    """Yield the rows of a CSV (header row required) or JSON Lines manifest."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def _import_file(task):
+    """Process-pool worker: hash and copy one file into the blob store's
+    temp directory; the batch transaction places it."""
+    path, upload_folder = task
+    try:
+        with open(path, 'rb') as f:
+            return stage_blob(f, upload_folder), None
+    except OSError as e:
+        return None, str(e)
+
+
+@app.cli.command('import-resources')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False),
+              help='CSV or JSONL manifest (default: manifest.csv/.jsonl in DIRECTORY).')
+@click.option('--uploader', help='Account email for rows without an "uploader" column.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True, help='Rows per transaction.')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Hash/copy processes.')
+@click.option('--dry-run', is_flag=True, help='Validate the manifest without writing anything.')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and start from the first row.')
+def import_resources_command(directory, manifest, uploader, batch_size, workers, dry_run, restart):
+    """Bulk-load resources from files in DIRECTORY.
+
+    Manifest columns are the upload form fields (title, subject, semester,
+    resource_type, year_batch, description, tags, privacy), "file" (a path
+    relative to DIRECTORY) and optionally "uploader" (an account email).
+    Progress is committed with each batch, so re-running the same manifest
+    after an interruption carries on where it stopped.
+    """
+    if manifest is None:
+        manifest = next((os.path.join(directory, name) for name in ('manifest.csv', 'manifest.jsonl')
+                         if os.path.isfile(os.path.join(directory, name))), None)
+        if manifest is None:
+            raise click.UsageError('no --manifest given and no manifest.csv/.jsonl in DIRECTORY')
+    manifest = os.path.abspath(manifest)
+    upload_folder = app.config['UPLOAD_FOLDER']
+    conn = connect_db()
+    users = {}
+
+    def lookup_user(email):
+        email = (email or '').strip().lower()
+        if email not in users:
+            users[email] = conn.execute("SELECT id, college FROM users WHERE email=?", (email,)).fetchone()
+        return users[email]
+
+    def check_row(row):
+        fields, error = clean_resource_fields(row)
+        name = str(row.get('file') or '').strip()
+        path = os.path.join(directory, name)
+        user = lookup_user(row.get('uploader') or uploader)
+        if error:
+            return None, error
+        if not allowed_file(name):
+            return None, f'File type not allowed: {name!r}'
+        if not os.path.isfile(path):
+            return None, f'No such file: {name!r}'
+        if os.path.getsize(path) > app.config['MAX_CONTENT_LENGTH']:
+            return None, f'File too large: {name!r}'
+        if user is None:
+            return None, f"Unknown uploader: {row.get('uploader') or uploader!r}"
+        return (fields, path, secure_filename(os.path.basename(name)), user), None
+
+    done = 0
+    if not restart:
+        saved = conn.execute("SELECT rows_done FROM import_progress WHERE manifest=?", (manifest,)).fetchone()
+        done = saved['rows_done'] if saved else 0
+        if done:
+            click.echo(f"resuming after row {done}")
+    rows = itertools.islice(enumerate(read_manifest(manifest), 1), done, None)
+    pool = None if dry_run else ProcessPoolExecutor(max(1, workers))
+    stats = Counter()
+    started = time.monotonic()
+    try:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            valid = []
+            for line, row in batch:
+                item, error = check_row(row)
+                if error:
+                    stats['invalid'] += 1
+                    click.echo(f"row {line}: {error}", err=True)
+                else:
+                    valid.append(item)
+            if dry_run:
+                stats['valid'] += len(valid)
+                continue
+
+            tasks = [(path, upload_folder) for _, path, _, _ in valid]
+            stored = pool.map(_import_file, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+            blobs, resources, scopes, staged = [], [], set(), []
+            for (fields, path, original_filename, user), (blob, error) in zip(valid, stored):
+                if error:
+                    stats['invalid'] += 1
+                    click.echo(f"{path}: {error}", err=True)
+                    continue
+                content_hash, file_size, tmp_path = blob
+                blob_path = blob_relpath(content_hash)
+                staged.append((tmp_path, content_hash))
+                blobs.append((content_hash, blob_path, file_size))
+                resources.append((user['id'], *(fields[k] for k in RESOURCE_FIELDS), user['college'],
+                                  blob_path, original_filename, file_size, content_hash))
+                scopes.add((fields['privacy'], user['college']))
+
+            # One write transaction per batch: rows, their jobs and the
+            # progress marker land together or not at all
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for tmp_path, content_hash in staged:
+                    place_blob(tmp_path, content_hash, upload_folder)
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM resources").fetchone()[0]
+                conn.executemany("INSERT OR IGNORE INTO blobs (sha256, path, size) VALUES (?,?,?)", blobs)
+                conn.executemany("""
+                    INSERT INTO resources (user_id, title, subject, semester, resource_type,
+                    year_batch, description, tags, privacy, college, filename, original_filename, file_size,
+                    content_hash)
+                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                """, resources)
+                for kind in PROCESSING_JOBS:
+                    conn.execute("INSERT INTO jobs (kind, resource_id, max_attempts) "
+                                 "SELECT ?, id, ? FROM resources WHERE id > ?",
+                                 (kind, app.config['JOB_MAX_ATTEMPTS'], last_id))
+                for privacy, college in scopes:
+                    bump_data_version(conn, privacy, college)
+                done = batch[-1][0]
+                conn.execute("""
+                    INSERT INTO import_progress (manifest, rows_done) VALUES (?, ?)
+                    ON CONFLICT(manifest) DO UPDATE SET rows_done=excluded.rows_done,
+                                                        updated_at=CURRENT_TIMESTAMP
+                """, (manifest, done))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                for tmp_path, _ in staged:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                raise
+            stats['imported'] += len(resources)
+            rate = stats['imported'] / max(time.monotonic() - started, 1e-6)
+            click.echo(f"row {done}: {stats['imported']} imported, {stats['invalid']} skipped ({rate:.0f}/s)")
+        if stats['imported']:
+            # One full similar-resources rebuild instead of a job per row
+            with conn:
+                enqueue_job(conn, 'similar_rebuild', unique=True)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        conn.close()
+
+    if dry_run:
+        click.echo(f"dry run: {stats['valid']} rows would be imported, {stats['invalid']} invalid")
+    else:
+        click.echo(f"done: {stats['imported']} imported, {stats['invalid']} skipped")
+
+
+@app.cli.command('build-similar')
+def build_similar_command():
+    """Rebuild the similar-resources index for every resource now."""
+    conn = connect_db()
+    try:
+        started = time.monotonic()
+        count = build_similarity_index(conn)
+    finally:
+        conn.close()
+    method = 'NumPy/SciPy' if np is not None else 'SQL (install numpy and scipy for the vectorized build)'
+    click.echo(f"indexed {count} resources in {time.monotonic() - started:.1f}s using {method}")
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted and precompressed copies of the CSS/JS files."""
+    for filename, dist_name in sorted(asset_pipeline.build_all().items()):
+        click.echo(f"{filename} -> {dist_name}")
+    if brotli is None:
+        click.echo("note: brotli not installed, only .gz variants written")
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any hot route falls back to a full table scan, or a paginated
+    listing sorts instead of reading an index in order."""
+    saved_db, saved_workers = app.config['DATABASE'], app.config['JOB_WORKERS']
+    app.config['JOB_WORKERS'] = 0
+    with _db_pool_lock:
+        saved_pool = _db_pool[:]
+        _db_pool.clear()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            app.config['DATABASE'] = os.path.join(tmp, 'plans.db')
+            init_db()
+            run_migrations()
+            conn = connect_db()
+            conn.executescript("""
+                INSERT INTO users (name, email, password_hash, college, branch, semester)
+                VALUES ('A', 'a@plan', '', 'College A', 'CSE', '3'),
+                       ('B', 'b@plan', '', 'College B', 'ECE', '5');
+                INSERT INTO resources (user_id, title, subject, semester, resource_type, year_batch,
+                                       privacy, college, filename, original_filename)
+                VALUES (1, 'Trees', 'DSA', '3', 'Notes', '2024', 'public', 'College A', 'x', 'x.pdf'),
+                       (2, 'Signals', 'DSP', '5', 'Notes', '2024', 'private', 'College B', 'y', 'y.pdf');
+                INSERT INTO reviews (resource_id, user_id, rating) VALUES (1, 2, 4);
+                INSERT INTO bookmarks (user_id, resource_id) VALUES (1, 1);
+            """)
+            statements = []
+            conn.set_trace_callback(statements.append)
+            # Requests borrow this one traced connection from the pool
+            _db_pool.append(conn)
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess.update(user_id=1, user_name='A', user_college='College A')
+            failures = []
+            for route in QUERY_PLAN_ROUTES + SORTED_PLAN_ROUTES:
+                statements.clear()
+                resp = client.get(route.format(resource_id=1))
+                if resp.status_code != 200:
+                    failures.append(f"{route}: HTTP {resp.status_code}")
+                # Every statement the request ran; trigger bodies are traced as comments
+                checked = [st for st in statements if not st.lstrip().startswith('--')]
+                for sql in checked:
+                    for line in query_plan_problems(conn, sql, route in SORTED_PLAN_ROUTES):
+                        failures.append(f"{route}: {line}\n    {' '.join(sql.split())}")
+                click.echo(f"{route}: {len(checked)} statements checked")
+            conn.set_trace_callback(None)
+            g.pop('db', None)
+            with _db_pool_lock:
+                _db_pool.clear()
+            conn.close()
+    finally:
+        app.config['DATABASE'], app.config['JOB_WORKERS'] = saved_db, saved_workers
+        with _db_pool_lock:
+            _db_pool[:] = saved_pool
+    if failures:
+        raise click.ClickException("query plan problems found:\n" + "\n".join(failures))
+    click.echo("OK: no full table scans or unindexed listing sorts")
 
 
 @app.template_filter('timeago')
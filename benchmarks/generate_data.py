@@ -0,0 +1,143 @@
+"""Fill a database with synthetic users, resources, reviews and bookmarks.
+
+    python benchmarks/generate_data.py --scale 10k
+    python benchmarks/generate_data.py --scale 1m --db /tmp/bench-1m.db
+
+The same --seed always produces the same rows, so benchmark results from
+different commits are comparable. The database defaults to the app's own
+(FLASK_DATABASE or instance/neural_breach.db) and is appended to; pass
+--db with a fresh path to keep benchmark data separate. Every account gets
+the password "benchmark"; bench0@example.com is the one the harness uses.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+PASSWORD = 'benchmark'
+
+COLLEGES = ['IIT Bombay', 'IIT Delhi', 'NIT Trichy', 'BITS Pilani', 'VIT Vellore', 'RVCE Bangalore',
+            'PES University', 'Anna University', 'Jadavpur University', 'DTU Delhi']
+BRANCHES = ['CSE', 'ECE', 'EEE', 'MECH', 'CIVIL', 'IT', 'CHEM']
+SUBJECTS = ['Data Structures', 'Algorithms', 'Operating Systems', 'Computer Networks', 'DBMS',
+            'Digital Electronics', 'Signals and Systems', 'Thermodynamics', 'Fluid Mechanics',
+            'Engineering Mathematics', 'Machine Learning', 'Compiler Design', 'Control Systems',
+            'Strength of Materials', 'Microprocessors', 'Theory of Computation']
+RESOURCE_TYPES = ['Notes', 'Question Paper', 'Assignment', 'Lab Manual', 'Slides', 'Reference Book']
+YEARS = [str(y) for y in range(2018, 2027)]
+WORDS = ('unit module chapter lecture summary revision important exam solved previous year tutorial '
+         'handwritten complete syllabus practice problems theory derivation diagram formula quick '
+         'midterm endsem viva graph tree heap hashing sorting scheduling memory paging deadlock '
+         'routing tcp normalization transaction circuit amplifier entropy laplace fourier matrix').split()
+FILE_TYPES = ['pdf'] * 6 + ['pptx', 'docx', 'png', 'jpg', 'txt', 'zip']
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k', help='number of resources')
+    parser.add_argument('--resources', type=int, help='exact number of resources (overrides --scale)')
+    parser.add_argument('--users', type=int, help='default: one per 20 resources')
+    parser.add_argument('--reviews-per-resource', type=float, default=1.5)
+    parser.add_argument('--bookmarks-per-user', type=float, default=8)
+    parser.add_argument('--files', type=int, default=64, help='distinct files shared by the resources')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='database path (default: the app database)')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['FLASK_DATABASE'] = os.path.abspath(args.db)
+    os.environ.setdefault('FLASK_JOB_WORKERS', '0')
+    sys.path.insert(0, ROOT)
+    from app import app, connect_db, store_blob, register_blob, bump_data_version, password_hasher
+
+    n_resources = args.resources or SCALES[args.scale]
+    n_users = args.users or max(10, n_resources // 20)
+    rng = random.Random(args.seed)
+    started = time.monotonic()
+    conn = connect_db()
+    conn.execute("PRAGMA synchronous = OFF")
+    print(f"generating {n_users} users, {n_resources} resources into {app.config['DATABASE']}")
+
+    # Users: one real KDF hash shared by every account keeps this fast
+    password_hash = password_hasher.hash(PASSWORD)
+    users = []
+    for i in range(n_users):
+        users.append((f'Bench User {i}', f'bench{i}@example.com', password_hash, COLLEGES[i % len(COLLEGES)],
+                      rng.choice(BRANCHES), str(rng.randint(1, 8)), words(rng, 6)))
+    conn.executemany("""
+        INSERT OR IGNORE INTO users (name, email, password_hash, college, branch, semester, bio)
+        VALUES (?,?,?,?,?,?,?)
+    """, users)
+    user_rows = conn.execute("SELECT id, college FROM users WHERE email LIKE 'bench%@example.com'").fetchall()
+    conn.commit()
+
+    # A small pool of real files, so downloads and previews have bytes to serve
+    blobs = []
+    for i in range(args.files):
+        ext = FILE_TYPES[i % len(FILE_TYPES)]
+        payload = (f'synthetic {ext} file {i}\n' + words(rng, 50) + '\n').encode() * rng.randint(10, 2000)
+        sha, size, path = store_blob(io.BytesIO(payload))
+        register_blob(conn, sha, size, path)
+        blobs.append((sha, size, path, ext))
+    conn.commit()
+
+    batch = []
+    now = time.time()
+    for i in range(n_resources):
+        uploader = rng.choice(user_rows)
+        sha, size, path, ext = rng.choice(blobs)
+        subject = rng.choice(SUBJECTS)
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - rng.random() * 3 * 365 * 86400))
+        batch.append((uploader['id'], f"{subject} {words(rng, 3)}", subject, str(rng.randint(1, 8)),
+                      rng.choice(RESOURCE_TYPES), rng.choice(YEARS), words(rng, rng.randint(8, 40)),
+                      ', '.join(rng.sample(WORDS, 3)), 'private' if rng.random() < 0.2 else 'public',
+                      uploader['college'], path, f'{subject.lower().replace(" ", "_")}_{i}.{ext}', size, sha,
+                      int(rng.paretovariate(1.2)) - 1, created))
+        if len(batch) == 5000 or i == n_resources - 1:
+            conn.executemany("""
+                INSERT INTO resources (user_id, title, subject, semester, resource_type, year_batch,
+                description, tags, privacy, college, filename, original_filename, file_size, content_hash,
+                download_count, created_at)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            """, batch)
+            conn.commit()
+            batch = []
+            print(f"  {i + 1} resources ({time.monotonic() - started:.0f}s)")
+
+    resource_ids = [r[0] for r in conn.execute("SELECT id FROM resources ORDER BY id DESC LIMIT ?", (n_resources,))]
+    user_ids = [u['id'] for u in user_rows]
+
+    reviews = []
+    for _ in range(int(n_resources * args.reviews_per_resource)):
+        reviews.append((rng.choice(resource_ids), rng.choice(user_ids), rng.choices([1, 2, 3, 4, 5], [1, 1, 3, 5, 4])[0],
+                        words(rng, rng.randint(0, 20))))
+    for start in range(0, len(reviews), 20000):
+        conn.executemany("INSERT OR IGNORE INTO reviews (resource_id, user_id, rating, comment) VALUES (?,?,?,?)",
+                         reviews[start:start + 20000])
+        conn.commit()
+
+    bookmarks = [(uid, rng.choice(resource_ids)) for uid in user_ids
+                 for _ in range(int(rng.expovariate(1 / args.bookmarks_per_user)))]
+    conn.executemany("INSERT OR IGNORE INTO bookmarks (user_id, resource_id) VALUES (?,?)", bookmarks)
+
+    # Drop any cached listings a running server holds for the old data
+    bump_data_version(conn, 'public', None)
+    for college in COLLEGES:
+        bump_data_version(conn, 'private', college)
+    conn.commit()
+    conn.close()
+    print(f"done in {time.monotonic() - started:.0f}s: {n_users} users, {n_resources} resources, "
+          f"{len(reviews)} reviews, {len(bookmarks)} bookmarks")
+
+
+if __name__ == '__main__':
+    main()
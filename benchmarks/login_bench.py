@@ -0,0 +1,97 @@
+"""Login throughput benchmark for sizing the password-hash cost settings.
+
+Runs concurrent logins against a scratch database through the Flask test
+client, so it measures the KDF pool rather than the network:
+
+    python benchmarks/login_bench.py --concurrency 32 --requests 400
+    python benchmarks/login_bench.py --method pbkdf2_sha256 --iterations 300000
+
+Cost and pool settings are passed as FLASK_* variables, exactly as in
+production. Compare the p99 it prints with the login latency target; raise
+the cost until p99 gets close, or add workers/cores.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='total logins')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--users', type=int, default=20, help='distinct accounts')
+    parser.add_argument('--method', choices=['scrypt', 'pbkdf2_sha256'])
+    parser.add_argument('--scrypt-n', type=int)
+    parser.add_argument('--iterations', type=int, help='PBKDF2 iterations')
+    parser.add_argument('--workers', type=int, help='PASSWORD_HASH_WORKERS')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='login-bench-')
+    os.environ['FLASK_DATABASE'] = os.path.join(scratch, 'bench.db')
+    os.environ['FLASK_JOB_WORKERS'] = '0'
+    for name, value in [('PASSWORD_HASH_METHOD', args.method and f'"{args.method}"'),
+                        ('PASSWORD_SCRYPT_N', args.scrypt_n),
+                        ('PASSWORD_PBKDF2_ITERATIONS', args.iterations),
+                        ('PASSWORD_HASH_WORKERS', args.workers)]:
+        if value is not None:
+            os.environ['FLASK_' + name] = str(value)
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    app.config['PASSWORD_HASH_QUEUE'] = max(app.config['PASSWORD_HASH_QUEUE'], args.concurrency)
+    for i in range(args.users):
+        app.test_client().post('/register', data=dict(
+            name=f'bench{i}', email=f'bench{i}@example.com', password='correct horse',
+            college='Bench', branch='CSE', semester='1'))
+
+    latencies, failures = [], []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client_loop():
+        client = app.test_client()
+        for i in counter:
+            email = f'bench{i % args.users}@example.com'
+            start = time.perf_counter()
+            resp = client.post('/login', data=dict(email=email, password='correct horse'))
+            elapsed = time.perf_counter() - start
+            with client.session_transaction() as sess:
+                sess.clear()
+            with lock:
+                (latencies if resp.status_code == 302 else failures).append(elapsed)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(args.concurrency)]
+    wall = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall
+
+    cfg = app.config
+    cost = (f"n={cfg['PASSWORD_SCRYPT_N']} r={cfg['PASSWORD_SCRYPT_R']} p={cfg['PASSWORD_SCRYPT_P']}"
+            if cfg['PASSWORD_HASH_METHOD'] == 'scrypt' else f"iterations={cfg['PASSWORD_PBKDF2_ITERATIONS']}")
+    print(f"{cfg['PASSWORD_HASH_METHOD']} {cost}, {cfg['PASSWORD_HASH_WORKERS']} workers, "
+          f"{args.concurrency} clients")
+    print(f"{len(latencies)} ok, {len(failures)} failed in {wall:.2f}s = {len(latencies) / wall:.1f} logins/s")
+    if latencies:
+        print("latency ms: p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  mean {:.1f}".format(
+            *(percentile(latencies, p) * 1000 for p in (50, 95, 99)), statistics.mean(latencies) * 1000))
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
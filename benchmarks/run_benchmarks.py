@@ -0,0 +1,272 @@
+"""Latency and queries-per-request benchmark for the hot routes.
+
+Drives home, search (every filter and sort), resource_detail,
+download_resource, api_resources and /api/v1 either in-process through Flask's test
+client or over HTTP against a running server, then writes the latency
+distribution and SQL statement counts (read from the Server-Timing header)
+for each scenario to JSON:
+
+    python benchmarks/generate_data.py --scale 100k --db /tmp/bench.db
+    python benchmarks/run_benchmarks.py --db /tmp/bench.db
+    python benchmarks/run_benchmarks.py --url http://127.0.0.1:8000 --concurrency 32
+    python benchmarks/run_benchmarks.py --db /tmp/bench.db --compare benchmarks/results/<old>.json
+
+--compare prints the change in p50/p95 per scenario and exits non-zero if
+any p95 got slower than --threshold.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from generate_data import PASSWORD, SUBJECTS, RESOURCE_TYPES, BRANCHES, YEARS, WORDS  # noqa: E402
+
+SERVER_TIMING = re.compile(r'(\w+);dur=([\d.]+)(?:;desc="(\d+) queries")?')
+
+
+class TestClient:
+    """In-process client: one logged-in Flask test client per worker slot.
+    Logging in is done outside the timed request."""
+
+    def __init__(self, email):
+        from app import app
+        self.app = app
+        self.email = email
+        self.sessions = {}
+
+    def _client(self, slot):
+        if slot not in self.sessions:
+            client = self.app.test_client()
+            client.post('/login', data={'email': self.email, 'password': PASSWORD})
+            self.sessions[slot] = client
+        return self.sessions[slot]
+
+    def get(self, path, slot=0):
+        client = self._client(slot)
+        start = time.perf_counter()
+        resp = client.get(path)
+        body = resp.get_data()
+        elapsed = time.perf_counter() - start
+        resp.close()
+        return resp.status_code, resp.headers.get('Server-Timing', ''), body, elapsed
+
+
+class HTTPClient:
+    """Real HTTP with a logged-in cookie jar per worker slot."""
+
+    def __init__(self, email, base_url):
+        self.email = email
+        self.base_url = base_url.rstrip('/')
+        self.sessions = {}
+
+    def _opener(self, slot):
+        if slot not in self.sessions:
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            data = urllib.parse.urlencode({'email': self.email, 'password': PASSWORD}).encode()
+            opener.open(self.base_url + '/login', data).read()
+            self.sessions[slot] = opener
+        return self.sessions[slot]
+
+    def get(self, path, slot=0):
+        opener = self._opener(slot)
+        start = time.perf_counter()
+        try:
+            resp = opener.open(self.base_url + path)
+        except urllib.error.HTTPError as e:
+            resp = e
+        body = resp.read()
+        elapsed = time.perf_counter() - start
+        return resp.status, resp.headers.get('Server-Timing', ''), body, elapsed
+
+
+def scenarios(client, rng):
+    """(name, path factory) pairs. Resource ids come from the API so they are
+    visible to the benchmark user in either client mode."""
+    status, _, body, _ = client.get('/api/resources?limit=100')
+    if status != 200:
+        sys.exit(f"could not list resources (HTTP {status}); is the benchmark user seeded?")
+    page = json.loads(body)
+    ids = [r['id'] for r in page['resources']]
+    if not ids:
+        sys.exit("no resources visible; run benchmarks/generate_data.py first")
+    q = lambda: rng.choice(WORDS)  # noqa: E731
+    items = [
+        ('home', lambda: '/home'),
+        ('search', lambda: '/search'),
+        ('search_q', lambda: f'/search?q={q()}'),
+        ('search_q_two_terms', lambda: f'/search?q={q()}+{q()}'),
+        ('search_subject', lambda: '/search?' + urllib.parse.urlencode({'subject': rng.choice(SUBJECTS)})),
+        ('search_semester', lambda: f'/search?semester={rng.randint(1, 8)}'),
+        ('search_type', lambda: '/search?' + urllib.parse.urlencode({'type': rng.choice(RESOURCE_TYPES)})),
+        ('search_branch', lambda: f'/search?branch={rng.choice(BRANCHES)}'),
+        ('search_year_batch', lambda: f'/search?year_batch={rng.choice(YEARS)}'),
+        ('search_privacy', lambda: '/search?privacy=private'),
+        ('search_semester_type', lambda: '/search?' + urllib.parse.urlencode(
+            {'semester': rng.randint(1, 8), 'type': rng.choice(RESOURCE_TYPES)})),
+        ('resource_detail', lambda: f'/resource/{rng.choice(ids)}'),
+        ('download_resource', lambda: f'/resource/{rng.choice(ids)}/download'),
+        ('api_resources', lambda: '/api/resources'),
+    ]
+    for sort in ('latest', 'popular', 'rated'):
+        items.append((f'search_sort_{sort}', lambda sort=sort: f'/search?sort={sort}'))
+        items.append((f'api_resources_{sort}', lambda sort=sort: f'/api/resources?sort={sort}&limit=50'))
+    items.append(('search_sort_relevance', lambda: f'/search?q={q()}&sort=relevance'))
+    if page.get('next_cursor'):
+        items.append(('api_resources_page2', lambda: f"/api/resources?limit=100&after={page['next_cursor']}"))
+        items.append(('api_v1_resources_page2', lambda: f"/api/v1/resources?limit=100&after={page['next_cursor']}"))
+    items += [
+        ('api_v1_resources', lambda: '/api/v1/resources?limit=100'),
+        ('api_v1_resources_fields', lambda: '/api/v1/resources?limit=100&fields=id,title,avg_rating'),
+        ('api_v1_search', lambda: f'/api/v1/search?q={q()}'),
+        ('api_v1_resource', lambda: f'/api/v1/resources/{rng.choice(ids)}'),
+        ('api_v1_reviews', lambda: f'/api/v1/resources/{rng.choice(ids)}/reviews'),
+    ]
+    return items
+
+
+def percentile(values, pct):
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def run_scenario(client, make_path, iterations, concurrency, warmup):
+    for _ in range(warmup):
+        client.get(make_path())
+    results, lock = [], threading.Lock()
+    paths = iter([make_path() for _ in range(iterations)])
+
+    def worker(slot):
+        for path in paths:
+            status, timing, _, elapsed = client.get(path, slot)
+            with lock:
+                results.append((status, timing, elapsed))
+
+    for slot in range(concurrency):
+        client.get('/home', slot)  # log every slot in before timing starts
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    wall = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall
+
+    latencies = sorted(r[2] * 1000 for r in results)
+    queries, db_ms, statuses = [], [], {}
+    for status, timing, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        for name, dur, count in SERVER_TIMING.findall(timing):
+            if name == 'db':
+                db_ms.append(float(dur))
+                queries.append(int(count or 0))
+    return {
+        'requests': len(results),
+        'throughput_rps': round(len(results) / wall, 1),
+        'status': statuses,
+        'latency_ms': {'p50': round(percentile(latencies, 50), 2), 'p90': round(percentile(latencies, 90), 2),
+                       'p95': round(percentile(latencies, 95), 2), 'p99': round(percentile(latencies, 99), 2),
+                       'mean': round(sum(latencies) / len(latencies), 2), 'max': round(latencies[-1], 2)},
+        'db_ms_mean': round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+        'queries_per_request': {'mean': round(sum(queries) / len(queries), 2), 'max': max(queries)}
+        if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(current, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline['meta'].get('commit')} ({baseline_path}):")
+    regressions = []
+    for name, now in current['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old:
+            continue
+        deltas = []
+        for key in ('p50', 'p95'):
+            before, after = old['latency_ms'][key], now['latency_ms'][key]
+            change = (after - before) / before if before else 0.0
+            deltas.append(f"{key} {before:.1f}->{after:.1f}ms ({change:+.0%})")
+            if key == 'p95' and change > threshold:
+                regressions.append(name)
+        q_old, q_new = (old.get('queries_per_request') or {}).get('mean'), (now.get('queries_per_request') or {}).get('mean')
+        if q_old is not None and q_new is not None and q_new != q_old:
+            deltas.append(f"queries {q_old}->{q_new}")
+        print(f"  {name:28} " + '  '.join(deltas))
+    if regressions:
+        print(f"\np95 regressions over {threshold:.0%}: {', '.join(regressions)}")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='database for the in-process client (default: the app database)')
+    parser.add_argument('--url', help='benchmark a running server over HTTP instead')
+    parser.add_argument('--user', default='bench0@example.com')
+    parser.add_argument('--iterations', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--only', help='regex: run matching scenarios only')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON path (default: benchmarks/results/<commit>-<client>.json)')
+    parser.add_argument('--compare', help='earlier results JSON to diff against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed p95 slowdown for --compare')
+    args = parser.parse_args()
+
+    if args.url:
+        client, mode = HTTPClient(args.user, args.url), 'http'
+    else:
+        if args.db:
+            os.environ['FLASK_DATABASE'] = os.path.abspath(args.db)
+        os.environ.setdefault('FLASK_JOB_WORKERS', '0')
+        sys.path.insert(0, ROOT)
+        client, mode = TestClient(args.user), 'test'
+
+    rng = random.Random(args.seed)
+    report = {
+        'meta': {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                 'client': mode, 'url': args.url, 'database': os.environ.get('FLASK_DATABASE'),
+                 'concurrency': args.concurrency, 'iterations': args.iterations, 'seed': args.seed,
+                 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                 'machine': f"{platform.machine()} x{os.cpu_count()}"},
+        'scenarios': {},
+    }
+    for name, make_path in scenarios(client, rng):
+        if args.only and not re.search(args.only, name):
+            continue
+        result = run_scenario(client, make_path, args.iterations, args.concurrency, args.warmup)
+        report['scenarios'][name] = result
+        lat, q = result['latency_ms'], result['queries_per_request'] or {}
+        print(f"{name:28} p50 {lat['p50']:8.2f}  p95 {lat['p95']:8.2f}  p99 {lat['p99']:8.2f} ms"
+              f"  {result['throughput_rps']:8.1f} req/s  queries {q.get('mean', '-')}")
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"{report['meta']['commit']}-{mode}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+    if args.compare and not compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -34,6 +34,117 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   }
 
+  // ─── CHUNKED UPLOAD ────────────────────────────
+  // The upload form sends its file to /api/uploads in chunks, a few at a
+  // time. A failed transfer can simply be submitted again: the session is
+  // remembered per file and only the missing chunks are sent.
+  const uploadForm = document.querySelector('form[data-chunked-upload]');
+  if (uploadForm && window.fetch && window.Blob) {
+    const PARALLEL_CHUNKS = 3;
+    const CHUNK_RETRIES = 4;
+    const apiBase = uploadForm.dataset.chunkedUpload;
+    const progress = document.getElementById('uploadProgress');
+    const submitBtn = uploadForm.querySelector('button[type="submit"]');
+
+    const say = text => {
+      progress.style.display = 'block';
+      progress.textContent = text;
+    };
+
+    const api = (url, options = {}) => fetch(url, { credentials: 'same-origin', ...options })
+      .then(resp => resp.status === 204 ? {} : resp.json().then(data => {
+        if (!resp.ok) throw Object.assign(new Error(data.error || resp.statusText), { status: resp.status });
+        return data;
+      }));
+
+    const sha256 = buf => {
+      if (!(window.crypto && crypto.subtle)) return Promise.resolve(null);
+      return crypto.subtle.digest('SHA-256', buf).then(d =>
+        Array.from(new Uint8Array(d), b => b.toString(16).padStart(2, '0')).join(''));
+    };
+
+    const sendChunk = (sess, file, index, attempt = 0) => {
+      const offset = index * sess.chunk_size;
+      return file.slice(offset, offset + sess.chunk_size).arrayBuffer()
+        .then(buf => sha256(buf).then(sum => fetch(`${apiBase}/${sess.id}?offset=${offset}`, {
+          method: 'PUT',
+          credentials: 'same-origin',
+          headers: Object.assign({ 'Content-Type': 'application/octet-stream' },
+                                 sum ? { 'X-Chunk-SHA256': sum } : {}),
+          body: buf,
+        })))
+        .then(resp => { if (!resp.ok) throw new Error(`chunk ${index}: HTTP ${resp.status}`); })
+        .catch(err => {
+          if (attempt >= CHUNK_RETRIES) throw err;
+          const wait = 500 * 2 ** attempt;
+          return new Promise(r => setTimeout(r, wait)).then(() => sendChunk(sess, file, index, attempt + 1));
+        });
+    };
+
+    const openSession = file => {
+      const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+      const saved = localStorage.getItem(key);
+      const fresh = () => api(apiBase, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size }),
+      }).then(sess => { localStorage.setItem(key, sess.id); return sess; });
+      const resumed = saved ? api(`${apiBase}/${saved}`).catch(fresh) : fresh();
+      return resumed.then(sess => Object.assign(sess, { key }));
+    };
+
+    uploadForm.addEventListener('submit', e => {
+      const file = document.getElementById('fileInput').files[0];
+      if (!file) return;
+      e.preventDefault();
+      submitBtn.disabled = true;
+      let sess;
+      openSession(file)
+        .then(s => {
+          sess = s;
+          const have = new Set(sess.received);
+          const todo = [];
+          for (let i = 0; i < sess.chunks; i++) if (!have.has(i)) todo.push(i);
+          let done = sess.chunks - todo.length;
+          say(`Uploading… ${Math.round(100 * done / sess.chunks)}%`);
+          const worker = () => {
+            const index = todo.shift();
+            if (index === undefined) return Promise.resolve();
+            return sendChunk(sess, file, index).then(() => {
+              done++;
+              say(`Uploading… ${Math.round(100 * done / sess.chunks)}%`);
+              return worker();
+            });
+          };
+          return Promise.all(Array.from({ length: PARALLEL_CHUNKS }, worker));
+        })
+        .then(() => {
+          say('Processing…');
+          const fields = {};
+          new FormData(uploadForm).forEach((value, name) => {
+            if (name !== 'file') fields[name] = value;
+          });
+          return api(`${apiBase}/${sess.id}/finalize`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(fields),
+          });
+        })
+        .then(res => {
+          localStorage.removeItem(sess.key);
+          window.location = res.url;
+        })
+        .catch(err => {
+          submitBtn.disabled = false;
+          if (!sess && !err.status) {
+            uploadForm.submit();  // API unreachable: fall back to a plain POST
+            return;
+          }
+          say(`✕ ${err.message}${err.status === 400 ? '' : ' — submit again to resume'}`);
+        });
+    });
+  }
+
   // ─── STAR RATING HOVER ─────────────────────────
   document.querySelectorAll('.star-rating').forEach(sr => {
     const labels = sr.querySelectorAll('label');
@@ -116,6 +227,81 @@ document.addEventListener('DOMContentLoaded', () => {
     }, 1000);
   }
 
+  // ─── BOOKMARK TOGGLES ─────────────────────────
+  // Bookmark forms still work without JS; with it, clicks flip the button at
+  // once and are sent together to /api/bookmarks a moment later.
+  const pendingBookmarks = [];
+  let bookmarkTimer = null;
+
+  const showBookmark = (id, on) => {
+    document.querySelectorAll(`form[data-bookmark="${id}"] button`).forEach(btn => {
+      btn.classList.toggle('bookmarked', on);
+      btn.textContent = on ? btn.dataset.on : btn.dataset.off;
+    });
+  };
+
+  const flushBookmarks = () => {
+    bookmarkTimer = null;
+    const ops = pendingBookmarks.splice(0);
+    fetch('/api/bookmarks', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ops }),
+    })
+      .then(resp => resp.ok ? resp.json() : Promise.reject(resp))
+      .then(data => {
+        Object.entries(data.bookmarks).forEach(([id, on]) => {
+          showBookmark(id, on);
+          const card = document.querySelector(`[data-bookmark-card="${id}"]`);
+          if (card) card.style.opacity = on ? '1' : '0.4';
+        });
+      })
+      .catch(() => {
+        // Put the buttons back the way they were before this batch
+        const undone = new Set();
+        ops.forEach(op => {
+          if (!undone.has(op.resource_id)) showBookmark(op.resource_id, op.action === 'remove');
+          undone.add(op.resource_id);
+        });
+      });
+  };
+
+  document.querySelectorAll('form[data-bookmark]').forEach(form => {
+    form.addEventListener('submit', e => {
+      e.preventDefault();
+      const id = form.dataset.bookmark;
+      const on = !form.querySelector('button').classList.contains('bookmarked');
+      showBookmark(id, on);
+      pendingBookmarks.push({ resource_id: Number(id), action: on ? 'add' : 'remove' });
+      clearTimeout(bookmarkTimer);
+      bookmarkTimer = setTimeout(flushBookmarks, 300);
+    });
+  });
+
+  // ─── LIVE UPDATES ─────────────────────────────
+  // Pages with a [data-live] button listen on /events instead of polling and
+  // offer a refresh once something they show has changed.
+  const liveBtn = document.querySelector('[data-live]');
+  if (liveBtn && window.EventSource) {
+    const source = new EventSource(liveBtn.dataset.live);
+    const watching = liveBtn.dataset.liveResource;
+    let fresh = 0;
+    const announce = label => {
+      fresh++;
+      liveBtn.textContent = `⟳ ${fresh} ${label}${fresh === 1 ? '' : 's'} — refresh`;
+      liveBtn.style.display = '';
+    };
+    if (watching) {
+      source.addEventListener('review', e => {
+        if (String(JSON.parse(e.data).resource_id) === watching) announce('new review');
+      });
+    } else {
+      source.addEventListener('resource', () => announce('new resource'));
+    }
+    liveBtn.addEventListener('click', () => window.location.reload());
+    window.addEventListener('pagehide', () => source.close());
+  }
+
   // ─── RESOURCE CARD RIPPLE ─────────────────────
   document.querySelectorAll('.resource-card').forEach(card => {
     card.addEventListener('click', function(e) {